@@ -49,7 +49,7 @@ def detect_language(
         mel = mel[None]
 
     # skip encoder forward pass if already-encoded audio features were given
-    if mel.shape[-2:] != (model.dims.n_audio_ctx, model.dims.n_audio_state):
+    if mel.shape[-1] != model.dims.n_audio_state:
         mel = model.encoder(mel)
 
     # forward pass using a single token, startoftranscript
@@ -265,7 +265,7 @@ class GreedyDecoder(TokenDecoder):
         else:
             next_tokens = categorical(logits, self.temperature)
 
-        logprobs = logits - mx.logsumexp(logits, axis=-1)
+        logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
 
         current_logprobs = logprobs[mx.arange(logprobs.shape[0]), next_tokens]
         sum_logprobs += current_logprobs * (tokens[:, -1] != self.eot)
@@ -334,53 +334,55 @@ class ApplyTimestampRules(LogitFilter):
         self.max_initial_timestamp_index = max_initial_timestamp_index
 
     def apply(self, logits: mx.array, tokens: mx.array) -> mx.array:
-        mask = np.zeros(logits.shape, np.float32)
+        # Build the mask with array ops only: reading `tokens` back to the host would
+        # wait for the previous step and stall the async-eval decode pipeline
+        vocab = mx.arange(logits.shape[-1])
+        is_timestamp = vocab >= self.tokenizer.timestamp_begin
+        mask = mx.zeros(logits.shape, mx.float32)
+
         # suppress <|notimestamps|> which is handled by without_timestamps
         if self.tokenizer.no_timestamps is not None:
-            mask[:, self.tokenizer.no_timestamps] = -np.inf
+            mask = mx.where(vocab == self.tokenizer.no_timestamps, -mx.inf, mask)
 
         ## timestamps have to appear in pairs, except directly before EOT; mask logits accordingly
-        tokens = tokens.tolist()
-        for k in range(len(tokens)):
-            seq = tokens[k][self.sample_begin :]
-            last_was_timestamp = (
-                len(seq) >= 1 and seq[-1] >= self.tokenizer.timestamp_begin
+        seq_len = tokens.shape[1] - self.sample_begin
+        if seq_len >= 1:
+            last_was_timestamp = tokens[:, -1:] >= self.tokenizer.timestamp_begin
+            if seq_len >= 2:
+                penultimate_was_timestamp = (
+                    tokens[:, -2:-1] >= self.tokenizer.timestamp_begin
+                )
+            else:
+                penultimate_was_timestamp = mx.ones_like(last_was_timestamp)
+
+            # has to be non-timestamp
+            mask = mx.where(
+                last_was_timestamp & penultimate_was_timestamp & is_timestamp,
+                -mx.inf,
+                mask,
             )
-            penultimate_was_timestamp = (
-                len(seq) < 2 or seq[-2] >= self.tokenizer.timestamp_begin
+            # cannot be normal text tokens
+            mask = mx.where(
+                last_was_timestamp
+                & ~penultimate_was_timestamp
+                & (vocab < self.tokenizer.eot),
+                -mx.inf,
+                mask,
             )
 
-            if last_was_timestamp:
-                if penultimate_was_timestamp:  # has to be non-timestamp
-                    mask[k, self.tokenizer.timestamp_begin :] = -np.inf
-                else:  # cannot be normal text tokens
-                    mask[k, : self.tokenizer.eot] = -np.inf
-
-            timestamps = [
-                i for i, v in enumerate(seq) if v > self.tokenizer.timestamp_begin
-            ]
-            if len(timestamps) > 0:
-                # timestamps shouldn't decrease; forbid timestamp tokens smaller than the last
-                # also force each segment to have a nonzero length, to prevent infinite looping
-                last_timestamp = timestamps[-1]
-                if not last_timestamp or penultimate_was_timestamp:
-                    last_timestamp += 1
-                mask[k, self.tokenizer.timestamp_begin : last_timestamp] = -np.inf
-
-        if len(tokens[0]) == self.sample_begin:
+        if seq_len == 0:
             # suppress generating non-timestamp tokens at the beginning
-            mask[:, : self.tokenizer.timestamp_begin] = -np.inf
+            mask = mx.where(is_timestamp, mask, -mx.inf)
 
             # apply the `max_initial_timestamp` option
             if self.max_initial_timestamp_index is not None:
                 last_allowed = (
                     self.tokenizer.timestamp_begin + self.max_initial_timestamp_index
                 )
-                mask[:, last_allowed + 1 :] = -np.inf
+                mask = mx.where(vocab > last_allowed, -mx.inf, mask)
 
         # if sum of probability over timestamps is above any other token, sample timestamp
-        mask = mx.array(mask)
-        logprobs = logits - mx.logsumexp(logits, axis=-1)
+        logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
         timestamp_logprob = logprobs[:, self.tokenizer.timestamp_begin :].logsumexp(
             axis=-1, keepdims=True
         )
@@ -538,10 +540,7 @@ class DecodingTask:
         if self.options.fp16:
             mel = mel.astype(mx.float16)
 
-        if mel.shape[-2:] == (
-            self.model.dims.n_audio_ctx,
-            self.model.dims.n_audio_state,
-        ):
+        if mel.shape[-1] == self.model.dims.n_audio_state:
             # encoded audio features are given; skip audio encoding
             audio_features = mel
         else:
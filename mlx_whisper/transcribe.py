@@ -2,7 +2,7 @@
 
 import sys
 import warnings
-from typing import List, Optional, Tuple, Union
+from typing import Generator, List, Optional, Tuple, Union
 
 import mlx.core as mx
 import numpy as np
@@ -21,6 +21,7 @@ from .decoding import DecodingOptions, DecodingResult
 from .load_models import load_model
 from .timing import add_word_timestamps
 from .tokenizer import LANGUAGES, get_tokenizer
+from .whisper import Whisper
 
 
 def _format_timestamp(seconds: float):
@@ -47,6 +48,18 @@ def _get_end(segments: List[dict]) -> Optional[float]:
     )
 
 
+# `transcribe` options that only the sequential loop uses
+_SEQUENTIAL_OPTIONS = (
+    "condition_on_previous_text",
+    "word_timestamps",
+    "prepend_punctuations",
+    "append_punctuations",
+    "clip_timestamps",
+    "hallucination_silence_threshold",
+    "truncate_mel",
+)
+
+
 class ModelHolder:
     model = None
     model_path = None
@@ -63,6 +76,7 @@ def transcribe(
     audio: Union[str, np.ndarray, mx.array],
     *,
     path_or_hf_repo: str = "mlx-community/whisper-tiny",
+    model: Optional[Whisper] = None,
     verbose: Optional[bool] = None,
     temperature: Union[float, Tuple[float, ...]] = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
     compression_ratio_threshold: Optional[float] = 2.4,
@@ -75,6 +89,8 @@ def transcribe(
     append_punctuations: str = "\"'.。,，!！?？:：”)]}、",
     clip_timestamps: Union[str, List[float]] = "0",
     hallucination_silence_threshold: Optional[float] = None,
+    batch_size: int = 1,
+    truncate_mel: bool = False,
     **decode_options,
 ):
     """
@@ -88,6 +104,9 @@ def transcribe(
     path_or_hf_repo: str
         The localpath to the Whisper model or HF Hub repo with the MLX converted weights.
 
+    model: Optional[Whisper]
+        An already loaded model to use instead of loading `path_or_hf_repo`.
+
     verbose: bool
         Whether to display the text being decoded to the console. If True, displays all the details,
         If False, displays minimal details. If None, does not display anything
@@ -137,14 +156,414 @@ def transcribe(
         When word_timestamps is True, skip silent periods longer than this threshold (in seconds)
         when a possible hallucination is detected
 
+    batch_size: int
+        If greater than 1, cut the audio into fixed 30-second windows and encode and decode
+        `batch_size` windows at a time. Windows are not conditioned on previous text and do not
+        re-seek to the last timestamp, trading a little accuracy for much higher throughput.
+        Ignored when `word_timestamps` is True, since the alignment needs sequential windows.
+
+    truncate_mel: bool
+        Encode only the real frames of each window, rounded up to the encoder's stride, instead
+        of padding it to 30 seconds. Much faster on short clips; best suited to models that
+        tolerate short inputs, such as the distil and turbo variants.
+
     Returns
     -------
     A dictionary containing the resulting text ("text") and segment-level details ("segments"), and
     the spoken language ("language"), which is detected when `decode_options["language"]` is None.
     """
 
+    if model is None:
+        dtype = mx.float16 if decode_options.get("fp16", True) else mx.float32
+        model = ModelHolder.get_model(path_or_hf_repo, dtype)
+
+    if batch_size > 1 and not word_timestamps:
+        options = dict(
+            verbose=verbose,
+            temperature=temperature,
+            compression_ratio_threshold=compression_ratio_threshold,
+            logprob_threshold=logprob_threshold,
+            no_speech_threshold=no_speech_threshold,
+            initial_prompt=initial_prompt,
+            **decode_options,
+        )
+        return _transcribe_fixed_windows(
+            model, [audio], batch_size=batch_size, options=[options]
+        )[0]
+
+    steps = _transcribe_steps(
+        model,
+        audio,
+        verbose=verbose,
+        temperature=temperature,
+        compression_ratio_threshold=compression_ratio_threshold,
+        logprob_threshold=logprob_threshold,
+        no_speech_threshold=no_speech_threshold,
+        condition_on_previous_text=condition_on_previous_text,
+        initial_prompt=initial_prompt,
+        word_timestamps=word_timestamps,
+        prepend_punctuations=prepend_punctuations,
+        append_punctuations=append_punctuations,
+        clip_timestamps=clip_timestamps,
+        hallucination_silence_threshold=hallucination_silence_threshold,
+        truncate_mel=truncate_mel,
+        **decode_options,
+    )
+    try:
+        mel_segment = next(steps)
+        while True:
+            mel_segment = steps.send(model.encoder(mel_segment[None])[0])
+    except StopIteration as stop:
+        return stop.value
+
+
+def transcribe_batch(
+    audios: List[Union[str, np.ndarray, mx.array]],
+    *,
+    path_or_hf_repo: str = "mlx-community/whisper-tiny",
+    model: Optional[Whisper] = None,
+    options: Optional[List[dict]] = None,
+    batch_size: int = 1,
+) -> List[dict]:
+    """
+    Transcribe several independent audio inputs, sharing each encoder forward pass
+
+    The inputs are processed in lockstep: the current 30-second window of every
+    unfinished input is stacked into one batch and encoded together, then each row
+    is decoded with that input's own options. With `batch_size` greater than 1, the
+    inputs without word timestamps are instead split into fixed 30-second windows as
+    in `transcribe`, pooled across inputs and encoded `batch_size` at a time.
+
+    Parameters
+    ----------
+    audios: List[Union[str, np.ndarray, mx.array]]
+        The paths to the audio files to open, or the audio waveforms
+
+    path_or_hf_repo: str
+        The localpath to the Whisper model or HF Hub repo with the MLX converted weights.
+
+    model: Optional[Whisper]
+        An already loaded model to use instead of loading `path_or_hf_repo`.
+
+    options: Optional[List[dict]]
+        Per-input keyword arguments, accepting the same keywords as `transcribe`
+        except `truncate_mel`, since the stacked windows must share one length
+
+    batch_size: int
+        The number of fixed windows per encoder forward pass; see `transcribe`.
+
+    Returns
+    -------
+    A list with one `transcribe` result dictionary per input, in input order.
+    """
+    if options is None:
+        options = [{} for _ in audios]
+    if len(options) != len(audios):
+        raise ValueError("options must have one entry per audio input")
+    if any(kwargs.get("truncate_mel") for kwargs in options):
+        raise ValueError("truncate_mel is not supported by transcribe_batch")
+
+    if model is None:
+        dtype = mx.float16 if options[0].get("fp16", True) else mx.float32
+        model = ModelHolder.get_model(path_or_hf_repo, dtype)
+
+    results: List[Optional[dict]] = [None] * len(audios)
+
+    if batch_size > 1:
+        fixed = [i for i, kwargs in enumerate(options) if not kwargs.get("word_timestamps")]
+        fixed_results = _transcribe_fixed_windows(
+            model,
+            [audios[i] for i in fixed],
+            batch_size=batch_size,
+            options=[options[i] for i in fixed],
+        )
+        for i, result in zip(fixed, fixed_results):
+            results[i] = result
+
+    sequential = [i for i, result in enumerate(results) if result is None]
+    steps = {
+        i: _transcribe_steps(model, audios[i], **options[i]) for i in sequential
+    }
+
+    # index of each unfinished input -> mel window it is waiting on
+    pending = {}
+    for i, step in steps.items():
+        try:
+            pending[i] = next(step)
+        except StopIteration as stop:
+            results[i] = stop.value
+
+    while pending:
+        indices = list(pending)
+        audio_features = model.encoder(mx.stack([pending[i] for i in indices]))
+        for row, i in enumerate(indices):
+            try:
+                pending[i] = steps[i].send(audio_features[row])
+            except StopIteration as stop:
+                results[i] = stop.value
+                del pending[i]
+
+    return results
+
+
+def _transcribe_fixed_windows(
+    model: Whisper,
+    audios: List[Union[str, np.ndarray, mx.array]],
+    *,
+    batch_size: int,
+    options: List[dict],
+) -> List[dict]:
+    """
+    Transcribe the fixed-stride 30-second windows of several inputs, `batch_size`
+    windows per encoder forward pass
+
+    The pending windows of all inputs are pooled, so short inputs share encoder
+    passes; each input then decodes its own windows with its own options.
+    """
+    steps = [
+        _fixed_window_steps(model, audio, batch_size=batch_size, **kwargs)
+        for audio, kwargs in zip(audios, options)
+    ]
+    results: List[Optional[dict]] = [None] * len(steps)
+
+    # index of each unfinished input -> mel windows it is waiting on
+    pending = {}
+    for i, step in enumerate(steps):
+        try:
+            pending[i] = next(step)
+        except StopIteration as stop:
+            results[i] = stop.value
+
+    while pending:
+        indices = list(pending)
+        windows = [window for i in indices for window in pending[i]]
+        audio_features = mx.concatenate(
+            [
+                model.encoder(mx.stack(windows[start : start + batch_size]))
+                for start in range(0, len(windows), batch_size)
+            ]
+        )
+        offset = 0
+        for i in indices:
+            n = len(pending[i])
+            try:
+                pending[i] = steps[i].send(audio_features[offset : offset + n])
+            except StopIteration as stop:
+                results[i] = stop.value
+                del pending[i]
+            offset += n
+
+    return results
+
+
+def _fixed_window_steps(
+    model: Whisper,
+    audio: Union[str, np.ndarray, mx.array],
+    *,
+    batch_size: int,
+    verbose: Optional[bool] = None,
+    temperature: Union[float, Tuple[float, ...]] = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+    compression_ratio_threshold: Optional[float] = 2.4,
+    logprob_threshold: Optional[float] = -1.0,
+    no_speech_threshold: Optional[float] = 0.6,
+    initial_prompt: Optional[str] = None,
+    **decode_options,
+) -> Generator[List[mx.array], mx.array, dict]:
+    """
+    The fixed-window loop of `transcribe`, with the encoder pass left to the caller
+
+    Yields up to `batch_size` padded 30-second mel windows at a time and expects their
+    encoded audio features to be sent back, stacked; returns the transcription result
+    dictionary. Each batch is decoded together; windows that fail the quality
+    thresholds are decoded again, still batched, at the next temperature.
+    """
+    # Options of the sequential loop that do not apply to fixed windows
+    for key in _SEQUENTIAL_OPTIONS:
+        decode_options.pop(key, None)
+
+    dtype = mx.float16 if decode_options.get("fp16", True) else mx.float32
+
+    mel = log_mel_spectrogram(audio, n_mels=model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-2] - N_FRAMES
+    seeks = list(range(0, content_frames, N_FRAMES))
+    windows = [
+        pad_or_trim(
+            mel[seek : seek + min(N_FRAMES, content_frames - seek)], N_FRAMES, axis=-2
+        ).astype(dtype)
+        for seek in seeks
+    ]
+
+    if decode_options.get("language", None) is None:
+        if not model.is_multilingual:
+            decode_options["language"] = "en"
+        elif windows:
+            _, probs = model.detect_language(windows[0])
+            decode_options["language"] = max(probs, key=probs.get)
+            if verbose is not None:
+                print(
+                    f"Detected language: {LANGUAGES[decode_options['language']].title()}"
+                )
+        else:
+            decode_options["language"] = "en"
+
+    language: str = decode_options["language"]
+    tokenizer = get_tokenizer(
+        model.is_multilingual,
+        num_languages=model.num_languages,
+        language=language,
+        task=decode_options.get("task", "transcribe"),
+    )
+    if initial_prompt is not None:
+        decode_options["prompt"] = tokenizer.encode(" " + initial_prompt.strip())
+
+    temperatures = (
+        [temperature] if isinstance(temperature, (int, float)) else temperature
+    )
+
+    def needs_fallback(result: DecodingResult) -> bool:
+        if no_speech_threshold is not None and result.no_speech_prob > no_speech_threshold:
+            return False  # silence
+        if (
+            compression_ratio_threshold is not None
+            and result.compression_ratio > compression_ratio_threshold
+        ):
+            return True  # too repetitive
+        if logprob_threshold is not None and result.avg_logprob < logprob_threshold:
+            return True  # average log probability is too low
+        return False
+
+    results: List[Optional[DecodingResult]] = [None] * len(windows)
+    for start in range(0, len(windows), batch_size):
+        audio_features = yield windows[start : start + batch_size]
+        remaining = list(range(audio_features.shape[0]))
+        for t in temperatures:
+            kwargs = {**decode_options}
+            if t > 0:
+                # disable beam_size and patience when t > 0
+                kwargs.pop("beam_size", None)
+                kwargs.pop("patience", None)
+            else:
+                # disable best_of when t == 0
+                kwargs.pop("best_of", None)
+
+            options = DecodingOptions(**kwargs, temperature=t)
+            decoded = model.decode(audio_features[mx.array(remaining)], options)
+            for row, result in zip(remaining, decoded):
+                results[start + row] = result
+            remaining = [
+                row for row, result in zip(remaining, decoded) if needs_fallback(result)
+            ]
+            if not remaining:
+                break
+
+    input_stride = N_FRAMES // model.dims.n_audio_ctx  # mel frames per output token: 2
+    time_precision = input_stride * HOP_LENGTH / SAMPLE_RATE  # 0.02 seconds per token
+    all_segments = []
+
+    def add_segment(seek: int, start: float, end: float, tokens: List[int], result):
+        text_tokens = [token for token in tokens if token < tokenizer.eot]
+        text = tokenizer.decode(text_tokens)
+        if start == end or text.strip() == "":
+            return
+        segment = {
+            "id": len(all_segments),
+            "seek": seek,
+            "start": start,
+            "end": end,
+            "text": text,
+            "tokens": tokens,
+            "temperature": result.temperature,
+            "avg_logprob": result.avg_logprob,
+            "compression_ratio": result.compression_ratio,
+            "no_speech_prob": result.no_speech_prob,
+        }
+        all_segments.append(segment)
+        if verbose:
+            print(
+                f"[{_format_timestamp(start)} --> {_format_timestamp(end)}] {text}"
+            )
+
+    for seek, result in zip(seeks, results):
+        if (
+            no_speech_threshold is not None
+            and result.no_speech_prob > no_speech_threshold
+            and not (
+                logprob_threshold is not None
+                and result.avg_logprob > logprob_threshold
+            )
+        ):
+            continue  # silent window
+
+        time_offset = float(seek * HOP_LENGTH / SAMPLE_RATE)
+        window_duration = min(N_FRAMES, content_frames - seek) * HOP_LENGTH / SAMPLE_RATE
+        tokens = result.tokens
+        is_timestamp = [token >= tokenizer.timestamp_begin for token in tokens]
+
+        # Split on timestamp tokens; a window cannot re-seek, so a tail without a
+        # closing timestamp runs to the end of the window
+        last_slice = 0
+        for i in range(1, len(tokens)):
+            if is_timestamp[i - 1] and is_timestamp[i]:
+                sliced = tokens[last_slice:i]
+                add_segment(
+                    seek,
+                    time_offset + (sliced[0] - tokenizer.timestamp_begin) * time_precision,
+                    time_offset + (sliced[-1] - tokenizer.timestamp_begin) * time_precision,
+                    sliced,
+                    result,
+                )
+                last_slice = i
+        tail = tokens[last_slice:]
+        if any(token < tokenizer.eot for token in tail):
+            start = time_offset
+            if tail and is_timestamp[last_slice]:
+                start += (tail[0] - tokenizer.timestamp_begin) * time_precision
+            end = time_offset + window_duration
+            if is_timestamp[-1]:
+                # single timestamp ending, as in the sequential loop
+                end = time_offset + (tail[-1] - tokenizer.timestamp_begin) * time_precision
+            add_segment(seek, start, end, tail, result)
+
+    return dict(
+        text="".join(segment["text"] for segment in all_segments),
+        segments=all_segments,
+        language=language,
+    )
+
+
+def _transcribe_steps(
+    model: Whisper,
+    audio: Union[str, np.ndarray, mx.array],
+    *,
+    verbose: Optional[bool] = None,
+    temperature: Union[float, Tuple[float, ...]] = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+    compression_ratio_threshold: Optional[float] = 2.4,
+    logprob_threshold: Optional[float] = -1.0,
+    no_speech_threshold: Optional[float] = 0.6,
+    condition_on_previous_text: bool = True,
+    initial_prompt: Optional[str] = None,
+    word_timestamps: bool = False,
+    prepend_punctuations: str = "\"'“¿([{-",
+    append_punctuations: str = "\"'.。,，!！?？:：”)]}、",
+    clip_timestamps: Union[str, List[float]] = "0",
+    hallucination_silence_threshold: Optional[float] = None,
+    truncate_mel: bool = False,
+    **decode_options,
+) -> Generator[mx.array, mx.array, dict]:
+    """
+    The transcription loop of `transcribe`, with the encoder pass left to the caller
+
+    Yields each padded 30-second mel window and expects its encoded audio features
+    to be sent back; returns the transcription result dictionary.
+    """
     dtype = mx.float16 if decode_options.get("fp16", True) else mx.float32
-    model = ModelHolder.get_model(path_or_hf_repo, dtype)
+    input_stride = N_FRAMES // model.dims.n_audio_ctx  # mel frames per output token: 2
+
+    def window_frames(n_frames: int) -> int:
+        # mel frames to encode for a window holding n_frames of real audio
+        if not truncate_mel:
+            return N_FRAMES
+        return min(N_FRAMES, max(1, -(-n_frames // input_stride)) * input_stride)
 
     # Pad 30-seconds of silence to the input audio, for slicing
     mel = log_mel_spectrogram(audio, n_mels=model.dims.n_mels, padding=N_SAMPLES)
@@ -169,7 +588,9 @@ def transcribe(
                     "Detecting language using up to the first 30 seconds. "
                     "Use the `language` decoding option to specify the language"
                 )
-            mel_segment = pad_or_trim(mel, N_FRAMES, axis=-2).astype(dtype)
+            mel_segment = pad_or_trim(
+                mel, window_frames(content_frames), axis=-2
+            ).astype(dtype)
             _, probs = model.detect_language(mel_segment)
             decode_options["language"] = max(probs, key=probs.get)
             if verbose is not None:
@@ -204,7 +625,7 @@ def transcribe(
     if word_timestamps and task == "translate":
         warnings.warn("Word-level timestamps on translations may not be reliable.")
 
-    def decode_with_fallback(segment: mx.array) -> DecodingResult:
+    def decode_with_fallback(audio_features: mx.array) -> DecodingResult:
         temperatures = (
             [temperature] if isinstance(temperature, (int, float)) else temperature
         )
@@ -221,7 +642,7 @@ def transcribe(
                 kwargs.pop("best_of", None)
 
             options = DecodingOptions(**kwargs, temperature=t)
-            decode_result = model.decode(segment, options)
+            decode_result = model.decode(audio_features, options)
 
             needs_fallback = False
             if (
@@ -246,7 +667,6 @@ def transcribe(
 
     clip_idx = 0
     seek = seek_clips[clip_idx][0]
-    input_stride = N_FRAMES // model.dims.n_audio_ctx  # mel frames per output token: 2
     time_precision = (
         input_stride * HOP_LENGTH / SAMPLE_RATE
     )  # time per output token: 0.02 (seconds)
@@ -291,10 +711,13 @@ def transcribe(
                 )
                 mel_segment = mel[seek : seek + segment_size]
                 segment_duration = segment_size * HOP_LENGTH / SAMPLE_RATE
-                mel_segment = pad_or_trim(mel_segment, N_FRAMES, axis=-2).astype(dtype)
+                mel_segment = pad_or_trim(
+                    mel_segment, window_frames(segment_size), axis=-2
+                ).astype(dtype)
 
                 decode_options["prompt"] = all_tokens[prompt_reset_since:]
-                result: DecodingResult = decode_with_fallback(mel_segment)
+                audio_features = yield mel_segment
+                result: DecodingResult = decode_with_fallback(audio_features)
 
                 tokens = np.array(result.tokens)
 
@@ -52,6 +52,7 @@ class MultiHeadAttention(nn.Module):
         xa=None,
         mask=None,
         kv_cache=None,
+        return_qk=False,
     ):
         q = self.query(x)
 
@@ -67,9 +68,27 @@ class MultiHeadAttention(nn.Module):
         else:
             k, v = kv_cache
 
-        wv, qk = self.qkv_attention(q, k, v, mask)
+        if return_qk:
+            wv, qk = self.qkv_attention(q, k, v, mask)
+        else:
+            wv, qk = self.fast_qkv_attention(q, k, v, mask), None
         return self.out(wv), (k, v), qk
 
+    def fast_qkv_attention(self, q, k, v, mask=None):
+        # Fused kernel that never materializes the (n_ctx, n_ctx) weights; use
+        # qkv_attention when the attention weights themselves are needed
+        n_batch, n_ctx, n_state = q.shape
+        scale = (n_state // self.n_head) ** -0.5
+        q = q.reshape(*q.shape[:2], self.n_head, -1).transpose(0, 2, 1, 3)
+        k = k.reshape(*k.shape[:2], self.n_head, -1).transpose(0, 2, 1, 3)
+        v = v.reshape(*v.shape[:2], self.n_head, -1).transpose(0, 2, 1, 3)
+        if mask is not None:
+            mask = mask[:n_ctx, :n_ctx].astype(q.dtype)
+
+        out = mx.fast.scaled_dot_product_attention(q, k, v, scale=scale, mask=mask)
+        out = out.transpose(0, 2, 1, 3)
+        return out.reshape(n_batch, n_ctx, n_state)
+
     def qkv_attention(self, q, k, v, mask=None):
         n_batch, n_ctx, n_state = q.shape
         scale = (n_state // self.n_head) ** -0.25
@@ -104,14 +123,14 @@ class ResidualAttentionBlock(nn.Module):
         self.mlp2 = nn.Linear(n_mlp, n_state)
         self.mlp_ln = nn.LayerNorm(n_state)
 
-    def __call__(self, x, xa=None, mask=None, kv_cache=None):
+    def __call__(self, x, xa=None, mask=None, kv_cache=None, return_cross_qk=False):
         kv, cross_kv = kv_cache if kv_cache else (None, None)
         y, kv, _ = self.attn(self.attn_ln(x), mask=mask, kv_cache=kv)
         x += y
         cross_qk = None
         if self.cross_attn:
             y, cross_kv, cross_qk = self.cross_attn(
-                self.cross_attn_ln(x), xa, kv_cache=cross_kv
+                self.cross_attn_ln(x), xa, kv_cache=cross_kv, return_qk=return_cross_qk
             )
             x += y
         x = x + self.mlp2(nn.gelu(self.mlp1(self.mlp_ln(x))))
@@ -139,8 +158,9 @@ class AudioEncoder(nn.Module):
     def __call__(self, x):
         x = nn.gelu(self.conv1(x))
         x = nn.gelu(self.conv2(x))
-        assert x.shape[1:] == self._positional_embedding.shape, "incorrect audio shape"
-        x = x + self._positional_embedding
+        # Inputs shorter than 30 s (truncated mel) use the leading positions only
+        assert x.shape[1] <= self._positional_embedding.shape[0], "incorrect audio shape"
+        x = x + self._positional_embedding[: x.shape[1]]
 
         for block in self.blocks:
             x, _, _ = block(x)
@@ -173,12 +193,15 @@ class TextDecoder(nn.Module):
             dtype
         )
 
-    def __call__(self, x, xa, kv_cache=None):
+    def __call__(self, x, xa, kv_cache=None, return_cross_qk=False):
         """
         x : mx.array, shape = (batch_size, <= n_ctx)
             the text tokens
         xa : mx.array, shape = (batch_size, n_audio_ctx, n_audio_state)
             the encoded audio features to be attended on
+        return_cross_qk : bool
+            whether to compute the cross-attention weights (used for word timestamps);
+            otherwise the fused attention kernel is used and cross_qk holds None
         """
         offset = kv_cache[0][0][0].shape[1] if kv_cache else 0
         x = (
@@ -191,7 +214,11 @@ class TextDecoder(nn.Module):
         cross_qk = [None] * len(self.blocks)
         for e, block in enumerate(self.blocks):
             x, kv_cache[e], cross_qk[e] = block(
-                x, xa, mask=self._mask, kv_cache=kv_cache[e]
+                x,
+                xa,
+                mask=self._mask,
+                kv_cache=kv_cache[e],
+                return_cross_qk=return_cross_qk,
             )
 
         x = self.ln(x)
@@ -248,7 +275,9 @@ class Whisper(nn.Module):
         return self.decoder(tokens, audio_features)[0]
 
     def forward_with_cross_qk(self, mel, tokens):
-        logits, _, cross_qk = self.decoder(tokens, self.encoder(mel))
+        logits, _, cross_qk = self.decoder(
+            tokens, self.encoder(mel), return_cross_qk=True
+        )
         return logits, cross_qk
 
     def __call__(self, mel, tokens):
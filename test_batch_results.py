@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Check that batch transcription results with word timestamps survive the result file round trip.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("orjson")
+pytest.importorskip("mlx_whisper")
+
+from whisper_servers.batch.transcription import _read_json, _write_json
+
+
+def test_result_with_words_round_trips(tmp_path):
+    # Whisper's word timings are numpy floats, as produced by mlx_whisper.timing
+    word = {"word": " hello", "start": np.float64(0.0), "end": np.float64(1.2), "probability": np.float64(0.98)}
+    result = {
+        "text": " hello",
+        "language": "en",
+        "segments": [{"id": 0, "start": 0.0, "end": 1.2, "text": " hello", "words": [word]}],
+    }
+    path = tmp_path / "result.json"
+    
+    _write_json(path, result)
+    
+    loaded = _read_json(path)
+    assert loaded["segments"][0]["words"] == [
+        {"word": " hello", "start": 0.0, "end": 1.2, "probability": 0.98}
+    ]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Check utterance segmentation in the realtime server's StreamSession.
+
+The Silero model is replaced by a stand-in that calls a frame speech when it is loud,
+so preroll, hangover cuts and flushes can be checked sample-exactly.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("mlx_whisper")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("av")
+
+from whisper_servers.common.config import settings
+from whisper_servers.realtime.transcription import StreamSession
+
+FRAME = StreamSession.FRAME_SIZE
+CONTEXT = StreamSession.CONTEXT_SIZE
+PREROLL = StreamSession.PREROLL_FRAMES
+LOUD = 16384  # int16 amplitude of speech frames; 0.5 after scaling
+
+
+class LoudnessVAD:
+    """Silero stand-in: speech probability 1 for loud frames, 0 for silence."""
+
+    def __init__(self):
+        self.inputs = []
+
+    def run(self, output_names, feeds):
+        frame = feeds["input"]
+        assert frame.shape == (1, CONTEXT + FRAME)
+        self.inputs.append(frame.copy())
+        prob = 1.0 if np.abs(frame[0, CONTEXT:]).max() > 0.1 else 0.0
+        return np.array([[prob]], dtype=np.float32), feeds["state"]
+
+
+def pcm(*frames):
+    """int16 PCM bytes for (value, n_frames) runs."""
+    return np.concatenate(
+        [np.full(n * FRAME, value, dtype=np.int16) for value, n in frames]
+    ).tobytes()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # A hangover of exactly 10 frames
+    monkeypatch.setattr(settings, "VAD_HANGOVER_MS", 10 * FRAME * 1000 // 16000)
+    return StreamSession(LoudnessVAD())
+
+
+def test_utterance_keeps_preroll_and_is_cut_after_hangover(session):
+    utterances = session.append(pcm((0, 10), (LOUD, 5), (0, 12)))
+
+    assert len(utterances) == 1
+    [utterance] = utterances
+    # preroll + speech + the silence that ended it
+    assert len(utterance) == (PREROLL + 5 + 10) * FRAME
+    assert not utterance[: PREROLL * FRAME].any()
+    assert np.allclose(utterance[PREROLL * FRAME : (PREROLL + 5) * FRAME], LOUD / 32768)
+    assert not utterance[(PREROLL + 5) * FRAME :].any()
+
+
+def test_speech_split_across_appends_gives_one_utterance(session):
+    assert session.append(pcm((0, 2), (LOUD, 3))) == []
+    assert session.append(pcm((LOUD, 2), (0, 5))) == []
+
+    [utterance] = session.append(pcm((0, 5)))
+
+    assert len(utterance) == (2 + 5 + 10) * FRAME
+
+
+def test_silence_alone_yields_nothing(session):
+    assert session.append(pcm((0, 50))) == []
+    assert session.flush() is None
+
+
+def test_flush_returns_buffered_speech_and_resets(session):
+    session.append(pcm((0, 6), (LOUD, 3)))
+
+    utterance = session.flush()
+
+    assert len(utterance) == (PREROLL + 3) * FRAME
+    assert session.flush() is None
+    assert not session._vad_input.any()
+
+
+def test_full_window_of_speech_is_cut_without_a_pause(monkeypatch):
+    monkeypatch.setattr(settings, "REALTIME_MAX_CHUNK_SAMPLES", 20 * FRAME)
+    session = StreamSession(LoudnessVAD())
+
+    utterances = session.append(pcm((LOUD, 25)))
+
+    assert [len(u) for u in utterances] == [20 * FRAME]
+    assert len(session.flush()) == 5 * FRAME
+
+
+def test_each_frame_carries_the_previous_frame_tail():
+    vad = LoudnessVAD()
+    session = StreamSession(vad)
+    audio = np.arange(3 * FRAME, dtype=np.int16)
+
+    session.append(audio.tobytes())
+
+    first, second, third = vad.inputs
+    assert not first[0, :CONTEXT].any()
+    assert np.array_equal(second[0, :CONTEXT], first[0, -CONTEXT:])
+    assert np.array_equal(third[0, :CONTEXT], second[0, -CONTEXT:])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Check the on-device timestamp mask of mlx_whisper's ApplyTimestampRules.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+mx = pytest.importorskip("mlx.core")
+pytest.importorskip("mlx_whisper")
+
+from mlx_whisper.decoding import ApplyTimestampRules
+from mlx_whisper.tokenizer import get_tokenizer
+
+TOKENIZER = get_tokenizer(False)
+TB = TOKENIZER.timestamp_begin
+EOT = TOKENIZER.eot
+N_VOCAB = 51864
+SOT = list(TOKENIZER.sot_sequence)
+WORD = TOKENIZER.encode(" hello")[0]
+
+
+def masked(history, max_initial_timestamp_index=None):
+    """
+    Apply the rules to one row per history and return which tokens are allowed.
+
+    The logits favour a text token, so the "timestamps outweigh text" rule stays out
+    of the way of the pairing rules under test.
+    """
+    rules = ApplyTimestampRules(TOKENIZER, len(SOT), max_initial_timestamp_index)
+    logits = np.zeros((len(history), N_VOCAB), dtype=np.float32)
+    logits[:, WORD] = 50.0
+    tokens = mx.array([SOT + h for h in history])
+    out = np.array(rules.apply(mx.array(logits), tokens))
+    return np.isfinite(out)
+
+
+def test_first_token_must_be_an_allowed_timestamp():
+    [allowed] = masked([[]], max_initial_timestamp_index=50)
+
+    assert not allowed[:TB].any()
+    assert allowed[TB : TB + 51].all()
+    assert not allowed[TB + 51 :].any()
+
+
+def test_no_timestamps_token_is_always_suppressed():
+    [allowed] = masked([[TB, WORD]])
+
+    assert not allowed[TOKENIZER.no_timestamps]
+
+
+def test_closing_timestamp_is_followed_by_timestamp_or_eot():
+    # text then a timestamp: the next token opens a new segment or ends the text
+    [allowed] = masked([[TB, WORD, TB + 10]])
+
+    assert not allowed[:EOT].any()
+    assert allowed[EOT]
+    assert allowed[TB + 10 :].all()
+
+
+def test_timestamp_pair_is_followed_by_text():
+    [allowed] = masked([[TB, WORD, TB + 10, TB + 10]])
+
+    assert not allowed[TB:].any()
+    assert allowed[WORD]
+
+
+def test_rows_are_masked_by_their_own_history():
+    paired, closing, text = masked([
+        [TB, WORD, TB + 10, TB + 10],
+        [TB, WORD, TB + 10],
+        [TB, WORD],
+    ])
+
+    assert not paired[TB:].any() and paired[WORD]
+    assert not closing[WORD] and closing[EOT] and closing[TB + 20]
+    assert text[WORD] and text[TB + 20]
+
+
+def test_timestamps_win_when_they_outweigh_every_text_token():
+    rules = ApplyTimestampRules(TOKENIZER, len(SOT), None)
+    logits = np.zeros((2, N_VOCAB), dtype=np.float32)
+    logits[0, WORD] = 50.0  # row 0: one dominant text token
+    logits[1, TB:] = 5.0  # row 1: timestamp mass dominates
+    tokens = mx.array([SOT + [TB, WORD]] * 2)
+
+    out = np.isfinite(np.array(rules.apply(mx.array(logits), tokens)))
+
+    assert out[0, WORD]
+    assert not out[1, :TB].any()
+    assert out[1, TB:].all()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Check the fixed-window and truncated-mel paths of mlx_whisper.transcribe.
+
+The model is a stand-in that passes the mel windows through as "features" and returns
+scripted tokens, so the seek and segment bookkeeping is checked without model weights.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+mx = pytest.importorskip("mlx.core")
+pytest.importorskip("mlx_whisper")
+
+from mlx_whisper import transcribe_batch
+from mlx_whisper.audio import N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram
+from mlx_whisper.decoding import DecodingResult
+from mlx_whisper.tokenizer import get_tokenizer
+from mlx_whisper.transcribe import _transcribe_steps
+
+TOKENIZER = get_tokenizer(False)
+TB = TOKENIZER.timestamp_begin
+
+
+def ts(seconds: float) -> int:
+    """Timestamp token for a time within a window (0.02 s resolution)."""
+    return TB + round(seconds / 0.02)
+
+
+def text(s: str) -> list:
+    return TOKENIZER.encode(s)
+
+
+class ScriptedModel:
+    """Whisper stand-in: the encoder is the identity and decode replays scripted tokens."""
+
+    def __init__(self, scripts):
+        self.dims = SimpleNamespace(n_mels=80, n_audio_ctx=1500)
+        self.is_multilingual = False
+        self.num_languages = 99
+        self.scripts = list(scripts)  # one token list per decoded window, in decode order
+        self.encoder_batches = []  # rows per encoder pass
+        self.decode_batches = []  # rows per decode call
+
+    def encoder(self, mel):
+        self.encoder_batches.append(mel.shape[0])
+        return mel
+
+    def decode(self, audio_features, options):
+        self.decode_batches.append(audio_features.shape[0])
+        return [
+            DecodingResult(
+                audio_features=features,
+                language="en",
+                tokens=self.scripts.pop(0),
+                avg_logprob=0.0,
+                no_speech_prob=0.0,
+                temperature=options.temperature,
+                compression_ratio=1.0,
+            )
+            for features in audio_features
+        ]
+
+
+def spans(result):
+    return [(s["start"], s["end"], s["text"]) for s in result["segments"]]
+
+
+def test_fixed_windows_offset_segments_by_window_seek():
+    # 45 s of audio: one full window and a 15 s tail window
+    audio = np.zeros(45 * SAMPLE_RATE, dtype=np.float32)
+    model = ScriptedModel([
+        [ts(0.0)] + text(" hello") + [ts(1.2)],
+        [ts(0.0)] + text(" world") + [ts(1.0), ts(1.0)] + text(" again") + [ts(2.0)],
+    ])
+
+    [result] = transcribe_batch(
+        [audio], model=model, batch_size=8, options=[{"language": "en"}]
+    )
+
+    assert model.encoder_batches == [2]
+    assert model.decode_batches == [2]
+    assert spans(result) == [
+        (0.0, 1.2, " hello"),
+        (30.0, 31.0, " world"),
+        (31.0, 32.0, " again"),
+    ]
+    assert [s["seek"] for s in result["segments"]] == [0, N_FRAMES, N_FRAMES]
+
+
+def test_fixed_windows_unfinished_tail_runs_to_window_end():
+    audio = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    model = ScriptedModel([[ts(0.5)] + text(" cut off")])
+
+    [result] = transcribe_batch(
+        [audio], model=model, batch_size=8, options=[{"language": "en"}]
+    )
+
+    assert spans(result) == [(0.5, 10.0, " cut off")]
+
+
+def test_fixed_windows_share_encoder_passes_across_inputs():
+    audios = [np.zeros(5 * SAMPLE_RATE, dtype=np.float32) for _ in range(3)]
+    model = ScriptedModel([[ts(0.0)] + text(f" clip {i}") + [ts(1.0)] for i in range(3)])
+
+    results = transcribe_batch(
+        audios, model=model, batch_size=2, options=[{"language": "en"}] * 3
+    )
+
+    # Three one-window inputs pooled into passes of at most batch_size rows
+    assert model.encoder_batches == [2, 1]
+    # Each input decodes its own window
+    assert model.decode_batches == [1, 1, 1]
+    assert [r["text"] for r in results] == [" clip 0", " clip 1", " clip 2"]
+
+
+def test_transcribe_batch_rejects_truncate_mel():
+    with pytest.raises(ValueError):
+        transcribe_batch(
+            [np.zeros(SAMPLE_RATE, dtype=np.float32)],
+            model=ScriptedModel([]),
+            options=[{"truncate_mel": True}],
+        )
+
+
+@pytest.mark.parametrize("n_samples", [SAMPLE_RATE, SAMPLE_RATE + 160, 7 * SAMPLE_RATE + 480])
+def test_truncate_mel_rounds_window_up_to_encoder_stride(n_samples):
+    audio = np.zeros(n_samples, dtype=np.float32)
+    content_frames = log_mel_spectrogram(audio, padding=N_SAMPLES).shape[-2] - N_FRAMES
+
+    steps = _transcribe_steps(ScriptedModel([]), audio, language="en", truncate_mel=True)
+    mel_segment = next(steps)
+    steps.close()
+
+    assert mel_segment.shape[-2] == content_frames + content_frames % 2
+    assert mel_segment.shape[-2] % 2 == 0
+
+
+def test_without_truncate_mel_windows_are_padded_to_30_seconds():
+    audio = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+    steps = _transcribe_steps(ScriptedModel([]), audio, language="en")
+    mel_segment = next(steps)
+    steps.close()
+
+    assert mel_segment.shape[-2] == N_FRAMES
@@ -19,6 +19,7 @@ class AudioFormat(str, Enum):
     MP3 = "mp3"
     FLAC = "flac"
     M4A = "m4a"
+    PCM_F32LE = "pcm_f32le"  # raw little-endian float32 samples, streaming only
 
 
 class TTSRequest(BaseModel):
@@ -52,6 +53,7 @@ class TTSStreamChunk(BaseModel):
     request_id: str
     chunk_index: int
     audio_data: str  # Base64 encoded audio chunk
+    sample_rate: Optional[int] = None
     is_final: bool = False
     timestamp: float
 
@@ -175,6 +175,13 @@ async def synthesize_text(request: TTSRequest, background_tasks: BackgroundTasks
             detail=f"Text too long. Maximum length is {config.max_text_length} characters"
         )
     
+    # Raw PCM has no container to store or return; it is only streamed
+    if request.audio_format == AudioFormat.PCM_F32LE:
+        raise HTTPException(
+            status_code=400,
+            detail="Audio format pcm_f32le is only available on the WebSocket stream"
+        )
+    
     # Check if model is loaded
     if csm_model is None:
         raise HTTPException(
@@ -210,6 +217,13 @@ async def synthesize_text_sync(request: TTSRequest):
             detail=f"Text too long. Maximum length is {config.max_text_length} characters"
         )
     
+    # Raw PCM has no container to store or return; it is only streamed
+    if request.audio_format == AudioFormat.PCM_F32LE:
+        raise HTTPException(
+            status_code=400,
+            detail="Audio format pcm_f32le is only available on the WebSocket stream"
+        )
+    
     start_time = time.time()
     
     try:
@@ -103,16 +103,21 @@ async def process_tts_stream(websocket: WebSocket, request: TTSRequest):
             chunk_audio = audio_data[start_idx:end_idx]
             
             # Convert chunk to requested format
-            buffer = io.BytesIO()
-            sf.write(buffer, chunk_audio, config.sample_rate, format='WAV')
-            buffer.seek(0)
-            audio_base64 = base64.b64encode(buffer.read()).decode('utf-8')
+            if request.audio_format == AudioFormat.PCM_F32LE:
+                # Raw samples; the client can play them without decoding a container
+                audio_bytes = np.asarray(chunk_audio, dtype="<f4").tobytes()
+            else:
+                buffer = io.BytesIO()
+                sf.write(buffer, chunk_audio, config.sample_rate, format='WAV')
+                audio_bytes = buffer.getvalue()
+            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
             
             # Send chunk
             chunk = TTSStreamChunk(
                 request_id=request.request_id,
                 chunk_index=chunk_index,
                 audio_data=audio_base64,
+                sample_rate=config.sample_rate,
                 is_final=(i == total_chunks - 1),
                 timestamp=time.time()
             )
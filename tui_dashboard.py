@@ -6,8 +6,9 @@ import asyncio
 import os
 import sys
 import time
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Any, Hashable, List, Optional, Tuple
 import subprocess
 
 import requests
@@ -17,10 +18,26 @@ from textual.widgets import Header, Footer, Static, Button, DataTable, Label, In
 from textual.reactive import reactive
 from rich.console import Console
 from rich.panel import Panel
+from rich.style import Style
 from rich.table import Table
 from rich.text import Text
 
 
+# Job status styles, parsed once instead of per row
+STATUS_STYLES = {
+    "completed": Style(color="green"),
+    "processing": Style(color="yellow"),
+    "failed": Style(color="red"),
+}
+DEFAULT_STATUS_STYLE = Style(color="blue")
+
+
+@lru_cache(maxsize=1024)
+def _format_timestamp(timestamp: float) -> str:
+    """Format a job timestamp for display; job timestamps never change once set."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
 class JobsTable(Static):
     """Widget for displaying transcription jobs."""
     
@@ -29,6 +46,8 @@ class JobsTable(Static):
     def __init__(self, server_url="http://localhost:8123"):
         super().__init__()
         self.server_url = server_url
+        # Last rendered panel, keyed on the job fields that are actually displayed
+        self._render_cache: Optional[Tuple[Hashable, Panel]] = None
     
     def on_mount(self):
         # Schedule the first refresh immediately
@@ -49,6 +68,13 @@ class JobsTable(Static):
     
     def render(self):
         """Render the jobs table."""
+        cache_key = tuple(
+            (job["id"], job["status"], job["created_at"], job["completed_at"])
+            for job in self.jobs
+        )
+        if self._render_cache is not None and self._render_cache[0] == cache_key:
+            return self._render_cache[1]
+        
         table = Table(title="Transcription Jobs", expand=True)
         table.add_column("ID", no_wrap=True)
         table.add_column("Status", no_wrap=True)
@@ -58,31 +84,23 @@ class JobsTable(Static):
         for job in self.jobs:
             job_id = job["id"]
             status = job["status"]
-            created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["created_at"]))
+            created_at = _format_timestamp(job["created_at"])
             
             if job["completed_at"]:
-                completed_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["completed_at"]))
+                completed_at = _format_timestamp(job["completed_at"])
             else:
                 completed_at = "-"
             
-            # Style based on status
-            if status == "completed":
-                status_style = "green"
-            elif status == "processing":
-                status_style = "yellow"
-            elif status == "failed":
-                status_style = "red"
-            else:
-                status_style = "blue"
-            
             table.add_row(
                 job_id,
-                Text(status, style=status_style),
+                Text(status, style=STATUS_STYLES.get(status, DEFAULT_STATUS_STYLE)),
                 created_at,
                 completed_at,
             )
         
-        return Panel(table)
+        panel = Panel(table)
+        self._render_cache = (cache_key, panel)
+        return panel
 
 
 class TranscriptionForm(Container):
@@ -185,16 +203,24 @@ class ResultView(Static):
     
     result = reactive(None)
     
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # Last rendered panel together with the result object it was built from
+        self._render_cache: Optional[Tuple[Any, Panel]] = None
+    
     def update_result(self, result):
         """Update the transcription result."""
+        # Assigning the reactive already schedules a repaint
         self.result = result
-        self.refresh()
     
     def render(self):
         """Render the transcription result."""
         if not self.result:
             return Panel("No transcription result yet", title="Result")
         
+        if self._render_cache is not None and self._render_cache[0] is self.result:
+            return self._render_cache[1]
+        
         text = self.result.get("text", "")
         language = self.result.get("language", "unknown")
         duration = self.result.get("duration", 0)
@@ -220,7 +246,7 @@ class ResultView(Static):
                 segment.get("text", ""),
             )
         
-        return Panel(
+        panel = Panel(
             Vertical(
                 Panel(result_table, title="Full Transcription"),
                 Panel(info_table, title="Information"),
@@ -228,6 +254,8 @@ class ResultView(Static):
             ),
             title="Transcription Result",
         )
+        self._render_cache = (self.result, panel)
+        return panel
 
 
 class MLXWhisperDashboard(App):
@@ -4,21 +4,26 @@ Real-time voice chat with Qwen3, TTS, and Whisper
 """
 
 import asyncio
-import pyaudio
-import wave
+import base64
 import numpy as np
-import soundfile as sf
-import io
-import threading
+import os
 import queue
+import re
+import shutil
+import threading
+import uuid
 from pathlib import Path
-import time
+from typing import Optional
 import json
-import websocket
-from websocket import create_connection
+import msgpack
+import websockets
+
+# pyaudio, onnxruntime and mlx_lm are imported where they are first needed, so
+# the menu comes up without paying for the audio, VAD and LLM stacks
 
-from mlx_lm import load, generate
-import mlx.core as mx
+
+# Where a streamed reply can be cut into a sentence for TTS
+SENTENCE_END = re.compile(r"[.!?]\s|\n")
 
 
 class RealTimeVoiceChat:
@@ -29,195 +34,478 @@ class RealTimeVoiceChat:
         self.sample_rate = 16000
         self.chunk_size = 1024
         self.channels = 1
-        self.format = pyaudio.paInt16
-        
-        # PyAudio instance
-        self.audio = pyaudio.PyAudio()
         
-        # Queues for audio processing
-        self.audio_queue = queue.Queue()
-        self.response_queue = queue.Queue()
+        # PyAudio instance, created on first use
+        self._audio = None
+        
+        # Silero VAD settings (expects 512-sample frames at 16 kHz). The model is shared
+        # with the realtime server and downloaded from the Hub if it is not on disk;
+        # the same environment variables configure both.
+        self.vad_model_path = Path(os.environ.get("VAD_MODEL_PATH", "models/silero_vad.onnx"))
+        self.vad_model_repo = os.environ.get("VAD_MODEL_REPO", "onnx-community/silero-vad")
+        self.vad_model_file = os.environ.get("VAD_MODEL_FILE", "onnx/model.onnx")
+        self.vad_frame_size = 512
+        self.vad_context_size = 64  # trailing samples of the previous frame fed in front (v5)
+        self.vad_on_threshold = 0.5
+        self.vad_off_threshold = 0.35
+        self.vad_hangover = 0.3  # seconds below the off threshold that end an utterance
+        
+        # Capture buffer handed over by PortAudio; a multiple of the VAD frame size
+        self.capture_buffer_size = 2048
+        self._vad_session = None  # loaded when a conversation starts
+        
+        # Preallocated capture ring shared with the audio thread. The producer only
+        # advances the write index and the consumer only advances the read index, so
+        # no lock is needed (int assignment is atomic under the GIL).
+        self.ring_frames = 64
+        self.audio_ring = np.empty((self.ring_frames, self.vad_frame_size), dtype=np.int16)
+        self._ring_write_idx = 0
+        self._ring_read_idx = 0
+        
+        # Scratch input for the VAD, refilled in place for every frame: the context
+        # samples followed by the frame
+        self._vad_input = np.zeros((1, self.vad_context_size + self.vad_frame_size), dtype=np.float32)
         
         # Whisper WebSocket
-        self.whisper_ws_url = "ws://localhost:8000/transcribe"
+        # Realtime server route (whisper_servers/realtime/api.py); REALTIME_PORT as on the server
+        self.whisper_ws_url = (
+            f"ws://localhost:{os.environ.get('REALTIME_PORT', '8000')}/v1/audio/transcriptions"
+        )
+        self._whisper_ws = None  # kept open across utterances
         
         # TTS settings
         self.tts_model = "dia"  # or "csm"
         self.dia_ws_url = "ws://localhost:8124/ws/tts"
         self.csm_rest_url = "http://localhost:8126"
-        
-        # Load Qwen model
+        self._dia_ws = None  # kept open across utterances
+        # Raw float32 PCM from DIA, played at the sample rate each chunk carries
+        self._playback_stream = None
+        self._playback_rate = None
+        self._playback_queue = queue.Queue()  # PCM chunks written by the playback thread
+        
+        # Qwen settings
+        self.system_prompt = "You are a friendly voice assistant. Keep responses short and conversational."
+        self.max_context_tokens = 4096  # start a fresh conversation past this
+        # Decoding is bandwidth-bound at batch 1, so fewer bits per weight and per
+        # cached key/value mean proportionally fewer bytes read per token
+        self.qwen_model_path = "mlx-community/Qwen2.5-7B-Instruct-3bit"
+        self.kv_bits = 8
+        self.kv_group_size = 64
+        
+        # Qwen model, loaded on the first reply or in the background when a
+        # conversation starts
         self.qwen_model = None
         self.qwen_tokenizer = None
-        self.load_qwen_model()
+        self._qwen_lock = threading.Lock()
         
         # Conversation state
         self.is_listening = False
-        self.conversation_history = []
+        
+    @property
+    def audio(self):
+        """PyAudio instance, created on first use"""
+        if self._audio is None:
+            import pyaudio
+            self._audio = pyaudio.PyAudio()
+        return self._audio
+        
+    def load_vad_model(self):
+        """Load Silero VAD ONNX model, downloading it first if needed"""
+        import onnxruntime as ort
+        
+        if not self.vad_model_path.exists():
+            from huggingface_hub import hf_hub_download
+            
+            print(f"📥 Downloading Silero VAD from {self.vad_model_repo}...")
+            downloaded = hf_hub_download(self.vad_model_repo, self.vad_model_file)
+            os.makedirs(self.vad_model_path.parent, exist_ok=True)
+            shutil.copyfile(downloaded, self.vad_model_path)
+        
+        available = ort.get_available_providers()
+        providers = [
+            p for p in ("CoreMLExecutionProvider", "CPUExecutionProvider")
+            if p in available
+        ]
+        self._vad_session = ort.InferenceSession(str(self.vad_model_path), providers=providers)
+        self._vad_sr = np.array(self.sample_rate, dtype=np.int64)
+        self.reset_vad()
+        
+    def reset_vad(self):
+        """Reset the recurrent VAD state and context between utterances"""
+        self._vad_state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._vad_input.fill(0)
+        
+    def ring_push(self, frame: np.ndarray) -> None:
+        """Store one VAD-sized frame in the capture ring (producer side)"""
+        self.audio_ring[self._ring_write_idx % self.ring_frames] = frame
+        self._ring_write_idx += 1
+        
+    def ring_pop(self) -> Optional[np.ndarray]:
+        """Take the oldest unread frame from the capture ring, or None if empty
+        
+        The frame is a view into the ring, valid until the producer wraps around
+        to its slot, so consume it right away.
+        """
+        write_idx = self._ring_write_idx
+        if write_idx == self._ring_read_idx:
+            return None
+        if write_idx - self._ring_read_idx > self.ring_frames:
+            # Consumer fell behind a full ring; skip the overwritten frames
+            self._ring_read_idx = write_idx - self.ring_frames
+        frame = self.audio_ring[self._ring_read_idx % self.ring_frames]
+        self._ring_read_idx += 1
+        return frame
+        
+    def ring_clear(self) -> None:
+        """Discard all unread frames"""
+        self._ring_read_idx = self._ring_write_idx
+        
+    def _pa_callback(self, in_data, frame_count, time_info, status):
+        """PyAudio capture callback: split the buffer into VAD frames in the ring"""
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        for start in range(0, len(samples) - self.vad_frame_size + 1, self.vad_frame_size):
+            self.ring_push(samples[start:start + self.vad_frame_size])
+        return (None, 0)  # pyaudio.paContinue
         
     def load_qwen_model(self):
         """Load Qwen3 model"""
+        from mlx_lm import load
+        
         print("🧠 Loading Qwen3-8B...")
-        model_path = "mlx-community/Qwen2.5-7B-Instruct-4bit"
-        self.qwen_model, self.qwen_tokenizer = load(model_path)
+        self.qwen_model, self.qwen_tokenizer = load(self.qwen_model_path)
+        self._init_chat_template()
+        self.reset_conversation()
         print("✅ Qwen3 loaded")
         
+    def ensure_qwen_model(self):
+        """Load Qwen3 unless it is loaded already (safe to call from any thread)"""
+        with self._qwen_lock:
+            if self.qwen_model is None:
+                self.load_qwen_model()
+        
+    def _init_chat_template(self):
+        """Pre-tokenize the static pieces of the chat template
+        
+        A turn then only tokenizes the user's words and splices them between
+        the cached piece ids.
+        """
+        marker, reply = "\x00", "\x01"
+        system = [{"role": "system", "content": self.system_prompt}]
+        user = {"role": "user", "content": marker}
+        
+        def render(messages, add_generation_prompt):
+            return self.qwen_tokenizer.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=add_generation_prompt
+            )
+        
+        system_text = render(system, False)
+        with_user = render(system + [user], True)
+        with_reply = render(system + [user, {"role": "assistant", "content": reply}], False)
+        
+        # e.g. "<|im_start|>user\n" / "<|im_end|>\n<|im_start|>assistant\n" / "<|im_end|>\n"
+        user_head, user_tail = with_user[len(system_text):].split(marker)
+        turn_end = with_reply[len(with_user) + len(reply):]
+        
+        def encode(text):
+            return self.qwen_tokenizer.encode(text, add_special_tokens=False)
+        
+        self._system_ids = encode(system_text)
+        self._user_head_ids = encode(user_head)
+        self._user_tail_ids = encode(user_tail)
+        self._turn_end_ids = encode(turn_end)
+        
+    def reset_conversation(self):
+        """Start a new conversation with the system prompt already prefilled"""
+        import mlx.core as mx
+        from mlx_lm.models.cache import make_prompt_cache
+        
+        self.kv_cache = make_prompt_cache(self.qwen_model)
+        
+        # Run the static system prompt through the model now, so the first turn
+        # only has to prefill the user's words
+        self.qwen_model(mx.array(self._system_ids)[None], cache=self.kv_cache)
+        mx.eval([c.state for c in self.kv_cache])
+        self._rendered_prefix_len = len(self._system_ids)  # tokens already fed into kv_cache
+        self._turn_count = 0
+        
     def record_audio(self, duration: float = 5.0) -> bytes:
         """Record audio from microphone"""
+        import pyaudio
+        
         print("🎤 Recording...")
         
         stream = self.audio.open(
-            format=self.format,
+            format=pyaudio.paInt16,
             channels=self.channels,
             rate=self.sample_rate,
             input=True,
             frames_per_buffer=self.chunk_size
         )
         
-        frames = []
+        # Raw 16-bit PCM, as expected by the Whisper WebSocket
+        frames = bytearray()
         num_chunks = int(self.sample_rate / self.chunk_size * duration)
         
         for _ in range(num_chunks):
-            data = stream.read(self.chunk_size)
-            frames.append(data)
+            frames.extend(stream.read(self.chunk_size))
             
         stream.stop_stream()
         stream.close()
         
-        # Convert to WAV
-        buffer = io.BytesIO()
-        with wave.open(buffer, 'wb') as wf:
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(self.audio.get_sample_size(self.format))
-            wf.setframerate(self.sample_rate)
-            wf.writeframes(b''.join(frames))
-            
-        buffer.seek(0)
-        return buffer.read()
-        
-    def transcribe_audio_realtime(self, audio_data: bytes) -> str:
-        """Transcribe audio using Whisper WebSocket"""
+        return bytes(frames)
+        
+    async def _ensure_ws(self, attr: str, url: str):
+        """Return the pooled WebSocket stored in attr, connecting if there is none"""
+        ws = getattr(self, attr)
+        if ws is None:
+            # asyncio enables TCP_NODELAY on its TCP transports
+            ws = await websockets.connect(url)
+            setattr(self, attr, ws)
+        return ws
+        
+    async def _ws_send(self, attr: str, url: str, payload):
+        """Send on the pooled WebSocket, reconnecting once if the server dropped it
+        
+        Bytes are sent as a binary frame and str as a text frame.
+        """
+        for attempt in range(2):
+            ws = await self._ensure_ws(attr, url)
+            try:
+                await ws.send(payload)
+                return ws
+            except (websockets.ConnectionClosed, ConnectionError):
+                setattr(self, attr, None)
+                if attempt:
+                    raise
+        
+    async def _drop_ws(self, attr: str) -> None:
+        """Close and forget a pooled WebSocket after an error"""
+        ws = getattr(self, attr)
+        setattr(self, attr, None)
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        
+    async def close_connections(self) -> None:
+        """Close the pooled WebSockets, which are bound to the running event loop"""
+        await self._drop_ws("_whisper_ws")
+        await self._drop_ws("_dia_ws")
+        
+    async def transcribe_audio_realtime(self, audio_data: bytes) -> str:
+        """Transcribe raw 16 kHz mono int16 PCM using Whisper WebSocket"""
         try:
-            ws = create_connection(self.whisper_ws_url)
-            
-            # Send audio data
-            ws.send_binary(audio_data)
+            # Send audio data, then ask for whatever the server's VAD still buffers
+            ws = await self._ws_send("_whisper_ws", self.whisper_ws_url, bytes(audio_data))
+            await ws.send(json.dumps({"type": "flush"}))
             
-            # Get transcription
-            result = ws.recv()
-            data = json.loads(result)
-            
-            ws.close()
+            # Collect the utterances until the flush reply
+            texts = []
+            while True:
+                data = msgpack.unpackb(await ws.recv())
+                if "error" in data:
+                    print(f"❌ Transcription error: {data['error']}")
+                    break
+                if data.get("text"):
+                    texts.append(data["text"].strip())
+                if data.get("flushed"):
+                    break
             
-            if "transcription" in data:
-                return data["transcription"]
-            else:
-                return ""
+            return " ".join(texts)
                 
         except Exception as e:
             print(f"❌ Transcription error: {e}")
+            await self._drop_ws("_whisper_ws")
             return ""
             
-    def generate_ai_response(self, user_input: str) -> str:
-        """Generate response using Qwen3"""
+    def generate_ai_response(self, user_input: str, on_sentence=None) -> str:
+        """Generate response using Qwen3
         
-        messages = [
-            {"role": "system", "content": "You are a friendly voice assistant. Keep responses short and conversational."},
-        ]
+        If on_sentence is given, it is called with each complete sentence as
+        soon as it has been generated.
+        """
+        from mlx_lm import stream_generate
+        from mlx_lm.models.cache import trim_prompt_cache
+        from mlx_lm.sample_utils import make_sampler
         
-        # Add recent history
-        for msg in self.conversation_history[-4:]:
-            messages.append(msg)
-            
-        messages.append({"role": "user", "content": user_input})
+        self.ensure_qwen_model()
         
-        # Format prompt
-        prompt = self.qwen_tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
+        if self._rendered_prefix_len > self.max_context_tokens:
+            self.reset_conversation()
         
-        # Generate
-        tokens = mx.array(self.qwen_tokenizer.encode(prompt))
+        # The KV cache holds the conversation so far; only tokenize the new words
+        if self._turn_count == 0:
+            prompt_ids = list(self._user_head_ids)
+        else:
+            prompt_ids = self._turn_end_ids + self._user_head_ids
+        prompt_ids += self.qwen_tokenizer.encode(user_input, add_special_tokens=False)
+        prompt_ids += self._user_tail_ids
         
-        response_tokens = generate(
+        # Generate
+        response = ""
+        response_len = 0
+        pending = ""
+        for chunk in stream_generate(
             self.qwen_model,
-            tokens,
-            temp=0.7,
+            self.qwen_tokenizer,
+            prompt_ids,
             max_tokens=100,
-            verbose=False
-        )
+            sampler=make_sampler(temp=0.7),
+            prompt_cache=self.kv_cache,
+            kv_bits=self.kv_bits,
+            kv_group_size=self.kv_group_size,
+            quantized_kv_start=0  # replies are short, quantize from the first token
+        ):
+            # The last chunk carries the detokenizer's finalized tail, so its text is
+            # kept even when its token is end-of-sequence
+            response += chunk.text
+            if chunk.token not in self.qwen_tokenizer.eos_token_ids:
+                response_len += 1
+            
+            if on_sentence is not None:
+                pending += chunk.text
+                ends = [m.end() for m in SENTENCE_END.finditer(pending)]
+                if ends:
+                    sentence, pending = pending[:ends[-1]].strip(), pending[ends[-1]:]
+                    if sentence:
+                        on_sentence(sentence)
+        
+        if on_sentence is not None and pending.strip():
+            on_sentence(pending.strip())
+        
+        # Keep the cache aligned with prompt + reply; the end-of-turn marker
+        # is rendered as part of the next prompt
+        self._rendered_prefix_len += len(prompt_ids) + response_len
+        self._turn_count += 1
+        excess = self.kv_cache[0].offset - self._rendered_prefix_len
+        if excess > 0:
+            trim_prompt_cache(self.kv_cache, excess)
+        
+        return response.strip()
+        
+    async def _tts_worker(self, sentences: asyncio.Queue) -> None:
+        """Speak queued sentences in order until the end-of-reply marker (None)"""
+        while True:
+            sentence = await sentences.get()
+            if sentence is None:
+                return
+            await self.synthesize_speech_streaming(sentence)
+                
+    async def speak_ai_response(self, user_input: str) -> str:
+        """Generate a reply and speak each sentence while the rest is still generating"""
+        loop = asyncio.get_running_loop()
+        sentences = asyncio.Queue()
+        tts_task = asyncio.create_task(self._tts_worker(sentences))
         
-        response = self.qwen_tokenizer.decode(response_tokens[0].tolist())
+        def queue_sentence(sentence: str) -> None:
+            # Called from the generation thread
+            loop.call_soon_threadsafe(sentences.put_nowait, sentence)
         
-        # Extract assistant response
-        if "<|im_start|>assistant" in response:
-            response = response.split("<|im_start|>assistant")[-1]
-            response = response.split("<|im_end|>")[0].strip()
-            
-        # Update history
-        self.conversation_history.append({"role": "user", "content": user_input})
-        self.conversation_history.append({"role": "assistant", "content": response})
+        try:
+            # MLX generation blocks, so keep it off the loop that receives TTS audio
+            response = await asyncio.to_thread(
+                self.generate_ai_response, user_input, on_sentence=queue_sentence
+            )
+        finally:
+            sentences.put_nowait(None)
+            await tts_task
         
+        await self.wait_playback()
         return response
         
-    def synthesize_speech_streaming(self, text: str) -> None:
-        """Synthesize and play speech via streaming"""
+    def _playback_worker(self) -> None:
+        """Write queued PCM chunks to the output stream so the event loop never blocks"""
+        while True:
+            chunk = self._playback_queue.get()
+            try:
+                self._playback_stream.write(chunk)
+            finally:
+                self._playback_queue.task_done()
+                
+    async def _ensure_playback(self, rate: int) -> None:
+        """Open the output stream at the given rate, and its writer thread once"""
+        if self._playback_stream is not None and self._playback_rate == rate:
+            return
+        import pyaudio
+        
+        start_worker = self._playback_stream is None
+        if not start_worker:
+            # The server changed rates; play out what was queued at the old one
+            await self.wait_playback()
+            self._playback_stream.close()
+        self._playback_stream = self.audio.open(
+            format=pyaudio.paFloat32,
+            channels=1,
+            rate=rate,
+            output=True
+        )
+        self._playback_rate = rate
+        if start_worker:
+            threading.Thread(target=self._playback_worker, daemon=True).start()
+            
+    async def wait_playback(self) -> None:
+        """Wait until all queued audio has been played"""
+        await asyncio.to_thread(self._playback_queue.join)
+        
+    async def synthesize_speech_streaming(self, text: str) -> None:
+        """Synthesize speech via streaming and queue it for playback"""
         
         if self.tts_model == "dia":
             # Use DIA WebSocket
-            ws = create_connection(self.dia_ws_url)
-            
             request = {
                 "text": f"[S1] {text}",
-                "request_id": f"voice_chat_{int(time.time())}",
-                "temperature": 0.8
+                "request_id": f"voice_chat_{uuid.uuid4().hex}",
+                "temperature": 0.8,
+                "audio_format": "pcm_f32le"
             }
             
-            ws.send(json.dumps(request))
+            ws = await self._ws_send("_dia_ws", self.dia_ws_url, json.dumps(request))
             
-            # Play audio chunks as they arrive
-            stream = None
-            
-            while True:
-                result = ws.recv()
-                data = json.loads(result)
+            try:
+                while True:
+                    result = await ws.recv()
+                    data = json.loads(result)
                 
-                if data.get("type") == "completion":
-                    break
-                elif "audio_data" in data:
-                    import base64
-                    audio_bytes = base64.b64decode(data["audio_data"])
-                    
-                    # Decode WAV
-                    audio_data, sr = sf.read(io.BytesIO(audio_bytes))
+                    if data.get("type") == "completion":
+                        break
+                    elif "error" in data:
+                        print(f"❌ TTS error: {data['error']}")
+                        break
+                    elif "audio_data" in data:
+                        # Chunks are raw float32 PCM, so they can be played as-is;
+                        # hand them to the playback thread as they arrive
+                        await self._ensure_playback(data["sample_rate"])
+                        self._playback_queue.put(base64.b64decode(data["audio_data"]))
                     
-                    if stream is None:
-                        # Initialize audio stream
-                        stream = self.audio.open(
-                            format=pyaudio.paFloat32,
-                            channels=1,
-                            rate=sr,
-                            output=True
-                        )
-                    
-                    # Play chunk
-                    stream.write(audio_data.astype(np.float32).tobytes())
-                    
-            if stream:
-                stream.stop_stream()
-                stream.close()
-                
-            ws.close()
+            except (websockets.WebSocketException, ConnectionError):
+                # Do not reuse a connection that may still carry this request's chunks
+                await self._drop_ws("_dia_ws")
+                raise
             
-    def voice_activity_detection(self, audio_chunk: np.ndarray) -> bool:
-        """Simple VAD based on energy"""
-        energy = np.sqrt(np.mean(audio_chunk**2))
-        return energy > 0.01  # Threshold
+    def voice_activity_detection(self, audio_chunk: np.ndarray) -> float:
+        """Speech probability of a 512-sample int16 frame from Silero VAD"""
+        ctx = self.vad_context_size
+        self._vad_input[0, :ctx] = self._vad_input[0, -ctx:]
+        np.multiply(audio_chunk, 1 / 32768.0, out=self._vad_input[0, ctx:], dtype=np.float32)
+        prob, self._vad_state = self._vad_session.run(
+            None,
+            {"input": self._vad_input, "state": self._vad_state, "sr": self._vad_sr}
+        )
+        return float(prob[0][0])
         
     async def conversation_loop(self):
         """Main conversation loop"""
+        import pyaudio
+        
+        # Load Qwen and prefill its system prompt while the VAD and microphone
+        # are set up and the user speaks the first sentence
+        threading.Thread(target=self.ensure_qwen_model, daemon=True).start()
+        
+        if self._vad_session is None:
+            self.load_vad_model()
         
         print("\n🎙️  Real-Time Voice Chat")
         print("=" * 50)
@@ -225,25 +513,35 @@ class RealTimeVoiceChat:
         print("\nListening...\n")
         
         silence_duration = 0
-        audio_buffer = []
+        frame_duration = self.vad_frame_size / self.sample_rate
+        audio_buffer = bytearray()  # raw int16 PCM of the current utterance
+        stream = None
         
         try:
+            # PortAudio fills the ring from its own thread while we run VAD/Whisper/TTS
             stream = self.audio.open(
-                format=self.format,
+                format=pyaudio.paInt16,
                 channels=self.channels,
                 rate=self.sample_rate,
                 input=True,
-                frames_per_buffer=self.chunk_size
+                frames_per_buffer=self.capture_buffer_size,
+                stream_callback=self._pa_callback
             )
+            stream.start_stream()
             
             while True:
-                # Read audio chunk
-                data = stream.read(self.chunk_size, exception_on_overflow=False)
-                audio_chunk = np.frombuffer(data, dtype=np.int16)
+                # Take the next VAD frame from the capture ring
+                audio_chunk = self.ring_pop()
+                if audio_chunk is None:
+                    await asyncio.sleep(frame_duration / 2)
+                    continue
+                
+                # Voice activity detection with hysteresis
+                speech_prob = self.voice_activity_detection(audio_chunk)
+                threshold = self.vad_off_threshold if self.is_listening else self.vad_on_threshold
                 
-                # Voice activity detection
-                if self.voice_activity_detection(audio_chunk):
-                    audio_buffer.append(data)
+                if speech_prob >= threshold:
+                    audio_buffer.extend(audio_chunk)
                     silence_duration = 0
                     
                     if not self.is_listening:
@@ -251,48 +549,41 @@ class RealTimeVoiceChat:
                         print("👂 Listening...")
                 else:
                     if self.is_listening:
-                        silence_duration += self.chunk_size / self.sample_rate
+                        audio_buffer.extend(audio_chunk)
+                        silence_duration += frame_duration
                         
-                        if silence_duration > 1.5:  # 1.5 seconds of silence
+                        if silence_duration > self.vad_hangover:
                             # Process recorded audio
                             self.is_listening = False
                             print("🤔 Processing...")
                             
-                            # Convert buffer to WAV
-                            buffer = io.BytesIO()
-                            with wave.open(buffer, 'wb') as wf:
-                                wf.setnchannels(self.channels)
-                                wf.setsampwidth(self.audio.get_sample_size(self.format))
-                                wf.setframerate(self.sample_rate)
-                                wf.writeframes(b''.join(audio_buffer))
-                            
-                            buffer.seek(0)
-                            audio_data = buffer.read()
-                            
-                            # Transcribe
-                            transcription = self.transcribe_audio_realtime(audio_data)
+                            # Transcribe (the PCM is sent as-is, no WAV container)
+                            transcription = await self.transcribe_audio_realtime(audio_buffer)
                             if transcription:
                                 print(f"You: {transcription}")
                                 
-                                # Generate response
-                                response = self.generate_ai_response(transcription)
+                                # Generate the response and speak it as it streams
+                                response = await self.speak_ai_response(transcription)
                                 print(f"AI: {response}")
                                 
-                                # Synthesize and play
-                                self.synthesize_speech_streaming(response)
-                                
                             # Clear buffer
-                            audio_buffer = []
+                            audio_buffer = bytearray()
                             silence_duration = 0
+                            self.reset_vad()
+                            # Drop audio captured while the assistant was speaking
+                            self.ring_clear()
                             print("\n👂 Listening...")
                             
         except KeyboardInterrupt:
             print("\n\n👋 Goodbye!")
         finally:
-            stream.stop_stream()
-            stream.close()
+            # The stream is unset if opening the audio device failed
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            await self.close_connections()
             
-    def test_pipeline(self):
+    async def test_pipeline(self):
         """Test the complete pipeline"""
         
         print("🧪 Testing Voice Pipeline")
@@ -300,56 +591,62 @@ class RealTimeVoiceChat:
         
         # Test recording
         print("\n1. Testing microphone (speak for 3 seconds)...")
-        audio_data = self.record_audio(3.0)
+        audio_data = await asyncio.to_thread(self.record_audio, 3.0)
         print(f"   Recorded {len(audio_data)} bytes")
         
         # Test transcription
         print("\n2. Testing transcription...")
-        text = self.transcribe_audio_realtime(audio_data)
+        text = await self.transcribe_audio_realtime(audio_data)
         print(f"   Transcribed: '{text}'")
         
         if text:
             # Test AI response
             print("\n3. Testing AI response...")
-            response = self.generate_ai_response(text)
+            response = await asyncio.to_thread(self.generate_ai_response, text)
             print(f"   AI says: '{response}'")
             
             # Test TTS
             print("\n4. Testing speech synthesis...")
-            self.synthesize_speech_streaming(response)
+            await self.synthesize_speech_streaming(response)
+            await self.wait_playback()
             print("   ✅ Audio played")
         
+        await self.close_connections()
         print("\n✅ Pipeline test complete!")
 
 
 def main():
     """Run real-time voice chat"""
     
+    # One instance for the whole session keeps the Qwen KV cache, the loaded
+    # models and the PyAudio instance alive across menu choices
     chat = RealTimeVoiceChat()
     
-    print("🎤 Real-Time Voice Chat with AI")
-    print("=" * 50)
-    print("\nOptions:")
-    print("1. Start voice conversation")
-    print("2. Test pipeline")
-    print("3. Switch TTS model (current: {})".format(chat.tts_model))
-    print("4. Exit")
-    
-    choice = input("\nChoice: ")
-    
-    if choice == "1":
-        asyncio.run(chat.conversation_loop())
-    elif choice == "2":
-        chat.test_pipeline()
-    elif choice == "3":
-        chat.tts_model = "csm" if chat.tts_model == "dia" else "dia"
-        print(f"Switched to {chat.tts_model}")
-        main()
-    elif choice == "4":
-        print("👋 Goodbye!")
-    else:
-        print("Invalid choice")
-        main()
+    while True:
+        print("🎤 Real-Time Voice Chat with AI")
+        print("=" * 50)
+        print("\nOptions:")
+        print("1. Start voice conversation")
+        print("2. Test pipeline")
+        print("3. Switch TTS model (current: {})".format(chat.tts_model))
+        print("4. Exit")
+        
+        choice = input("\nChoice: ")
+        
+        if choice == "1":
+            asyncio.run(chat.conversation_loop())
+            break
+        elif choice == "2":
+            asyncio.run(chat.test_pipeline())
+            break
+        elif choice == "3":
+            chat.tts_model = "csm" if chat.tts_model == "dia" else "dia"
+            print(f"Switched to {chat.tts_model}")
+        elif choice == "4":
+            print("👋 Goodbye!")
+            break
+        else:
+            print("Invalid choice")
 
 
 if __name__ == "__main__":
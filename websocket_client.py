@@ -3,21 +3,23 @@
 WebSocket client for testing real-time transcription.
 """
 import asyncio
-import json
 import os
 import argparse
-import base64
 import sys
 from pathlib import Path
 
-import websockets
+import msgpack
 import numpy as np
+import websockets
 
 
 async def send_audio_file(websocket, file_path, chunk_size=4000, interval=0.1):
     """
     Send an audio file to the WebSocket server in chunks.
     
+    The server answers once per utterance, so responses are received concurrently
+    with sending; a final flush message collects the trailing utterance.
+    
     Args:
         websocket: WebSocket connection
         file_path: Path to the audio file
@@ -28,36 +30,38 @@ async def send_audio_file(websocket, file_path, chunk_size=4000, interval=0.1):
     with open(file_path, "rb") as f:
         audio_data = f.read()
     
-    # Send the audio data in chunks
-    for i in range(0, len(audio_data), chunk_size):
-        chunk = audio_data[i:i+chunk_size]
-        
-        # Create a JSON message with base64-encoded audio
-        message = {
-            "audio": base64.b64encode(chunk).decode("utf-8"),
-            "sequence_number": i // chunk_size
-        }
-        
-        # Send the message
-        await websocket.send(json.dumps(message))
-        
-        # Receive and print the response
-        response = await websocket.recv()
-        result = json.loads(response)
-        
-        if "error" in result:
-            print(f"Error: {result['error']}")
-        else:
-            print(f"Transcription: {result.get('text', '')}")
-            if "segments" in result and result["segments"]:
-                for segment in result["segments"]:
+    # Print the transcriptions as the server sends them, until the flush reply
+    async def receive_results():
+        async for response in websocket:
+            result = msgpack.unpackb(response)
+            
+            if "error" in result:
+                print(f"Error: {result['error']}")
+            elif result.get("text"):
+                print(f"Transcription: {result['text']}")
+                for segment in result.get("segments") or []:
                     start = segment.get("start", 0)
                     end = segment.get("end", 0)
                     text = segment.get("text", "")
                     print(f"  [{start:.2f}s - {end:.2f}s] {text}")
+            if result.get("flushed"):
+                break
+    
+    receiver = asyncio.create_task(receive_results())
+    
+    # Send the audio data in chunks
+    for i in range(0, len(audio_data), chunk_size):
+        chunk = audio_data[i:i+chunk_size]
+        
+        # Send the raw audio as a binary frame
+        await websocket.send(chunk)
         
         # Wait before sending the next chunk
         await asyncio.sleep(interval)
+    
+    # Transcribe the speech still buffered on the server
+    await websocket.send('{"type":"flush"}')
+    await receiver
 
 
 async def capture_and_stream_audio(websocket, device=None, sample_rate=16000, channels=1, duration=None):
@@ -74,72 +78,89 @@ async def capture_and_stream_audio(websocket, device=None, sample_rate=16000, ch
     try:
         import sounddevice as sd
         
-        # Create a queue for thread-safe communication
-        audio_queue = asyncio.Queue(maxsize=20)
+        # 20 ms capture blocks, sent to the server in groups of 16 (~320 ms)
+        block_size = int(sample_rate * 0.02)
+        frames_per_send = 16
+        ring_size = frames_per_send * 8
         
-        # Get the current event loop
-        loop = asyncio.get_event_loop()
+        # Preallocated ring filled by the audio thread; the callback only copies into it
+        ring_buf = np.empty((ring_size, block_size), dtype=np.float32)
+        write_idx = 0
         
-        # Define a non-async callback for sounddevice that puts data in the queue
+        # Scratch buffers for the send path
+        send_f32 = np.empty((frames_per_send, block_size), dtype=np.float32)
+        send_i16 = np.empty((frames_per_send, block_size), dtype=np.int16)
+        
+        # Define a non-async callback for sounddevice that stores the block in the ring
         def audio_callback(indata, frames, time, status):
+            nonlocal write_idx
             if status:
                 print(f"Status: {status}")
             
             # Convert to mono if needed
+            row = ring_buf[write_idx % ring_size]
             if channels > 1:
-                indata = np.mean(indata, axis=1)
-            
-            # Convert to bytes
-            audio_bytes = (indata * 32767).astype(np.int16).tobytes()
-            
-            # Create a JSON message with base64-encoded audio
-            message = {
-                "audio": base64.b64encode(audio_bytes).decode("utf-8"),
-            }
-            
-            # Schedule putting the message into the queue using the event loop's thread
-            # This is thread-safe and avoids the "no running event loop" error
-            loop.call_soon_threadsafe(audio_queue.put_nowait, json.dumps(message))
+                np.mean(indata, axis=1, out=row)
+            else:
+                row[:] = indata[:, 0]
+            write_idx += 1
         
-        # Coroutine to process audio data from the queue and send to WebSocket
+        # Coroutine that takes audio from the ring and sends it to the WebSocket
         async def audio_producer():
+            read_idx = 0
             while True:
                 try:
-                    # Get the next message from the queue
-                    message = await audio_queue.get()
+                    if write_idx - read_idx < frames_per_send:
+                        # Wait for the audio thread to fill more blocks
+                        await asyncio.sleep(block_size / sample_rate)
+                        continue
+                    if write_idx - read_idx > ring_size:
+                        # Fell behind a full ring; skip the overwritten blocks
+                        read_idx = write_idx - ring_size
                     
-                    # Send the message
-                    await websocket.send(message)
+                    np.take(
+                        ring_buf,
+                        range(read_idx, read_idx + frames_per_send),
+                        axis=0,
+                        out=send_f32,
+                        mode="wrap",
+                    )
+                    read_idx += frames_per_send
                     
-                    # Receive and print the response
-                    try:
-                        response = await asyncio.wait_for(websocket.recv(), timeout=0.5)
-                        result = json.loads(response)
-                        
-                        if "error" in result:
-                            print(f"Error: {result['error']}")
-                        elif result.get("text"):
-                            print(f"Transcription: {result.get('text', '')}")
-                    except asyncio.TimeoutError:
-                        # No response yet, that's fine
-                        pass
+                    # Scale to the int16 range in place
+                    np.multiply(send_f32, 32768.0, out=send_f32)
+                    np.clip(send_f32, -32768, 32767, out=send_f32)
+                    send_i16[:] = send_f32
                     
-                    # Mark this task as done
-                    audio_queue.task_done()
+                    # Raw PCM is sent as a binary frame, no base64/JSON envelope needed
+                    await websocket.send(send_i16.tobytes())
                 except asyncio.CancelledError:
                     # Producer is being cancelled, exit the loop
                     break
                 except Exception as e:
                     print(f"Error in audio producer: {e}")
         
-        # Set up the audio stream
-        block_size = int(sample_rate * 0.5)  # 0.5 seconds per block
+        # Coroutine that prints transcriptions as the server sends them
+        async def response_consumer():
+            try:
+                async for response in websocket:
+                    result = msgpack.unpackb(response)
+                    
+                    if "error" in result:
+                        print(f"Error: {result['error']}")
+                    elif result.get("text"):
+                        print(f"Transcription: {result['text']}")
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"Error in response consumer: {e}")
         
         # Create an event to signal when to stop
         stop_event = asyncio.Event()
         
-        # Start the audio producer task
+        # Start the audio producer and response consumer tasks
         producer_task = asyncio.create_task(audio_producer())
+        consumer_task = asyncio.create_task(response_consumer())
         
         # Start the audio input stream
         stream = sd.InputStream(
@@ -165,11 +186,12 @@ async def capture_and_stream_audio(websocket, device=None, sample_rate=16000, ch
             # Clean up resources
             stream.stop()
             stream.close()
-            producer_task.cancel()
-            try:
-                await producer_task
-            except asyncio.CancelledError:
-                pass
+            for task in (producer_task, consumer_task):
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
                 
     except ImportError:
         print("Error: sounddevice module is required for microphone streaming")
@@ -22,7 +22,7 @@ def parse_args():
     # Realtime server command
     realtime_parser = subparsers.add_parser("realtime", help="Run the realtime transcription server")
     realtime_parser.add_argument("--port", type=int, help="Port to run the server on (default: 8000)")
-    realtime_parser.add_argument("--model", type=str, help="Model to use (default: tiny)")
+    realtime_parser.add_argument("--model", type=str, help="Model to use (default: distil-large-v3)")
     
     # Version command
     version_parser = subparsers.add_parser("version", help="Show version information")
@@ -6,13 +6,13 @@ from typing import Optional, List, Dict, Any
 from pathlib import Path
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
 from whisper_servers.common.config import settings
 from whisper_servers.common.logging import logger
-from whisper_servers.common.utils import save_upload_file, is_audio_file
+from whisper_servers.common.utils import save_upload_file, is_audio_content
 from whisper_servers.batch.transcription import transcription_service, TranscriptionJob
 
 
@@ -50,6 +50,7 @@ app = FastAPI(
     title="MLX Whisper Batch Transcription API",
     description="API for batch transcription of audio files using MLX Whisper",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
 )
 
 # Add CORS middleware
@@ -78,8 +79,10 @@ async def create_transcription(
     
     This endpoint is compatible with the OpenAI Whisper API.
     """
-    # Validate file type
-    if not file.filename or not is_audio_file(file.filename):
+    # Validate file type from its magic bytes before copying the whole upload
+    header = await file.read(12)
+    await file.seek(0)
+    if not is_audio_content(header):
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported file format. Supported formats: {', '.join(settings.SUPPORTED_FORMATS)}",
@@ -99,8 +102,13 @@ async def create_transcription(
         )
         
         # Wait for job to complete
-        while job.status not in ["completed", "failed"]:
-            await asyncio.sleep(0.5)
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=settings.MAX_TRANSCRIPTION_WAIT)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Transcription did not finish within {settings.MAX_TRANSCRIPTION_WAIT} seconds",
+            )
         
         if job.status == "failed":
             raise HTTPException(
@@ -110,20 +118,23 @@ async def create_transcription(
         
         # Format response based on requested format
         if response_format == "json":
-            if not job.result:
+            result = await transcription_service.get_result(job)
+            if not result:
                 raise HTTPException(
                     status_code=500,
                     detail="Transcription result is missing",
                 )
             
-            response = TranscriptionResponse(
-                text=job.result.get("text", ""),
-                language=job.result.get("language", ""),
-                duration=job.result.get("duration", 0.0),
-                segments=job.result.get("segments", []),
-                words=job.result.get("words", []) if word_timestamps else None,
-            )
-            return response
+            # Return the result dicts as-is; re-validating thousands of segments
+            # through TranscriptionResponse costs more than encoding them
+            return ORJSONResponse({
+                "task": "transcription",
+                "text": result.get("text", ""),
+                "language": result.get("language", ""),
+                "duration": result.get("duration", 0.0),
+                "segments": result.get("segments", []),
+                "words": result.get("words", []) if word_timestamps else None,
+            })
         else:
             # For future implementation of other formats like srt, vtt, etc.
             raise HTTPException(
@@ -131,6 +142,8 @@ async def create_transcription(
                 detail=f"Response format '{response_format}' not yet implemented",
             )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"Error during transcription: {e}")
         raise HTTPException(
@@ -186,3 +199,15 @@ async def health_check():
     Health check endpoint.
     """
     return {"status": "ok"}
+
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    Startup event handler.
+    """
+    # Pre-load and warm up the model
+    try:
+        await transcription_service.load_model()
+    except Exception as e:
+        logger.error(f"Failed to load model on startup: {e}")
@@ -2,51 +2,96 @@
 Module for handling batch transcriptions with the MLX Whisper large-v3 model.
 """
 import asyncio
-import json
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, Any, Optional, Union, List
 import os
 import time
 
 import mlx_whisper
-from pydantic import BaseModel, Field
+import numpy as np
+import orjson
 
 from whisper_servers.common.config import settings
 from whisper_servers.common.logging import logger
-from whisper_servers.common.utils import convert_to_wav, generate_unique_id
+from whisper_servers.common.utils import (
+    decode_audio,
+    generate_unique_id,
+    load_quantized_model,
+    model_repo,
+    run_blocking,
+    warmup_model,
+)
 
 
-class TranscriptionJob(BaseModel):
-    """Model representing a transcription job."""
+def _write_json(path: Path, obj: Any) -> None:
+    """Serialize obj with orjson and write it to path in one go."""
+    # Word timings come out of Whisper as numpy floats
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+
+
+def _remove_files(paths: List[Path]) -> None:
+    """Delete files, ignoring any that are already gone."""
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _read_json(path: Path) -> Any:
+    """Read and parse a JSON file with orjson."""
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+@dataclass(slots=True)
+class TranscriptionJob:
+    """Internal state of a transcription job; the API responds with its own schemas."""
     job_id: str
     input_file: Path
+    model: str
     output_file: Optional[Path] = None
     status: str = "pending"  # pending, processing, completed, failed
-    model: str
     word_timestamps: bool = False
     language: Optional[str] = None
     prompt: Optional[str] = None
     temperature: float = 0.0
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
-    created_at: float = Field(default_factory=time.time)
+    created_at: float = field(default_factory=time.time)
     completed_at: Optional[float] = None
-
-    model_config = {"arbitrary_types_allowed": True}
+    # Set once the job reaches a terminal state (completed or failed)
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False, compare=False)
 
 
 class TranscriptionService:
     """Service for handling transcription jobs using MLX Whisper."""
     
     def __init__(self):
-        self._semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_JOBS)
         self._model_path = settings.MODELS_DIR / settings.BATCH_MODEL
         self._model_loaded = False
         self._model = None
         self._jobs: Dict[str, TranscriptionJob] = {}
+        # One model call at a time, whoever makes it
+        self._gpu_sem = asyncio.Semaphore(1)
+        # LRU of results keyed on the decoded audio and the decoding options
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Jobs waiting for the batch worker; it outlives any one worker task, so a
+        # restarted worker picks up what was already queued
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Started lazily, since the service is instantiated at import time
+        self._batch_task: Optional[asyncio.Task] = None
+        self._gc_task: Optional[asyncio.Task] = None
+        # Job-invariant transcribe() arguments, built once; "model" is set on load
+        self._base_kwargs: Dict[str, Any] = {
+            "model": None,
+            "path_or_hf_repo": None,  # Use already loaded model
+            "batch_size": settings.BATCH_SIZE,
+        }
     
-    async def _load_model(self) -> None:
-        """Load the MLX Whisper model if not already loaded."""
+    async def load_model(self) -> None:
+        """Load the MLX Whisper model and warm it up, if not already loaded."""
         if self._model_loaded:
             return
         
@@ -56,11 +101,21 @@ class TranscriptionService:
             # Check if model exists, otherwise try to download it from the Hugging Face Hub
             model_path_or_repo = str(self._model_path)
             if not self._model_path.exists():
-                logger.info(f"Model not found locally, attempting to load from 'mlx-community/whisper-{settings.BATCH_MODEL}'")
-                model_path_or_repo = f"mlx-community/whisper-{settings.BATCH_MODEL}"
+                model_path_or_repo = model_repo(settings.BATCH_MODEL)
+                logger.info(f"Model not found locally, attempting to load from '{model_path_or_repo}'")
             
-            # Load model (use to_thread because model loading is CPU-bound)
-            self._model = await asyncio.to_thread(mlx_whisper.load_model, model_path_or_repo)
+            # Load model (in a worker thread because model loading is CPU-bound)
+            if settings.BATCH_MODEL_QUANT:
+                self._model = await run_blocking(
+                    load_quantized_model,
+                    model_path_or_repo,
+                    settings.MODELS_DIR / f"{settings.BATCH_MODEL}-q{settings.BATCH_MODEL_QUANT}",
+                    settings.BATCH_MODEL_QUANT,
+                )
+            else:
+                self._model = await run_blocking(mlx_whisper.load_model, model_path_or_repo)
+            self._base_kwargs["model"] = self._model
+            await run_blocking(warmup_model, self._base_kwargs)
             self._model_loaded = True
             logger.info(f"MLX Whisper model loaded successfully")
         except Exception as e:
@@ -105,67 +160,216 @@ class TranscriptionService:
         
         self._jobs[job_id] = job
         
-        # Start processing the job in the background
-        asyncio.create_task(self._process_job(job))
+        # Queue the job for the background batch worker
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_task = asyncio.create_task(self._batch_loop())
+            self._batch_task.add_done_callback(self._log_worker_exit)
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.create_task(self._gc_loop())
+        self._queue.put_nowait(job)
         
         return job
     
-    async def _process_job(self, job: TranscriptionJob) -> None:
+    @staticmethod
+    def _log_worker_exit(task: asyncio.Task) -> None:
+        """Log the exception that stopped the batch worker; the next job restarts it."""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Batch worker stopped: {task.exception()!r}")
+    
+    async def _gc_loop(self) -> None:
+        """
+        Every minute, drop finished jobs older than JOB_RETENTION_SECONDS together with
+        their uploaded input and result files.
+        """
+        while True:
+            await asyncio.sleep(60)
+            cutoff = time.time() - settings.JOB_RETENTION_SECONDS
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.status in ("completed", "failed") and job.completed_at < cutoff
+            ]
+            files = []
+            for job_id in expired:
+                job = self._jobs.pop(job_id)
+                files.append(job.input_file)
+                if job.output_file is not None:
+                    files.append(job.output_file)
+            if files:
+                try:
+                    await run_blocking(_remove_files, files)
+                except OSError as e:
+                    logger.error(f"Failed to delete files of evicted jobs: {e}")
+            if expired:
+                logger.info(f"Evicted {len(expired)} finished jobs")
+    
+    async def _batch_loop(self) -> None:
+        """
+        Collect queued jobs into batches and process them one batch at a time.
+        
+        A batch is dispatched once it holds BATCH_MAX_SIZE jobs or BATCH_MAX_WAIT_MS
+        has passed since its first job arrived.
+        """
+        loop = asyncio.get_running_loop()
+        max_wait = settings.BATCH_MAX_WAIT_MS / 1000
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + max_wait
+            
+            while len(batch) < settings.BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            await self._process_batch(batch)
+    
+    async def _process_batch(self, batch: List[TranscriptionJob]) -> None:
         """
-        Process a transcription job.
+        Process a batch of transcription jobs with shared encoder passes.
         
         Args:
-            job: The TranscriptionJob instance to process
+            batch: The TranscriptionJob instances to process together
         """
-        # Acquire semaphore to limit concurrent jobs
-        async with self._semaphore:
+        jobs: List[TranscriptionJob] = []
+        audios: List[np.ndarray] = []
+        keys: List[str] = []
+        
+        try:
+            # Ensure model is loaded
+            await self.load_model()
+        except Exception as e:
+            for job in batch:
+                self._fail_job(job, e)
+            return
+        
+        for job in batch:
             try:
                 # Update job status
                 job.status = "processing"
                 logger.info(f"Processing job {job.job_id} with file {job.input_file}")
                 
-                # Ensure model is loaded
-                await self._load_model()
-                
-                # Convert input file to WAV format
-                wav_file = await asyncio.to_thread(
-                    convert_to_wav, 
-                    job.input_file, 
-                    settings.UPLOAD_DIR / f"{job.job_id}.wav"
-                )
-                
-                # Transcribe the audio file
-                result = await asyncio.to_thread(
-                    mlx_whisper.transcribe,
-                    str(wav_file),
-                    path_or_hf_repo=None,  # Use already loaded model
-                    model=self._model,  # Pass the loaded model
-                    word_timestamps=job.word_timestamps,
-                    language=job.language,
-                    prompt=job.prompt,
-                    temperature=job.temperature,
-                )
-                
-                # Update job with results
-                job.result = result
-                job.status = "completed"
-                job.completed_at = time.time()
-                
-                # Save result to file
-                async with asyncio.to_thread(
-                    open, job.output_file, "w"
-                ) as f:
-                    await asyncio.to_thread(
-                        json.dump, result, f, indent=2
-                    )
-                
-                logger.info(f"Job {job.job_id} completed successfully")
-            
+                # Decode and resample the input file in-process
+                audio = await run_blocking(decode_audio, job.input_file)
+                key = await run_blocking(self._cache_key, job, audio)
             except Exception as e:
-                logger.error(f"Error processing job {job.job_id}: {e}")
-                job.status = "failed"
-                job.error = str(e)
-                job.completed_at = time.time()
+                self._fail_job(job, e)
+                continue
+            
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                logger.info(f"Job {job.job_id} matches a cached transcription")
+                await self._complete_job(job, cached)
+                continue
+            
+            jobs.append(job)
+            audios.append(audio)
+            keys.append(key)
+        
+        if not jobs:
+            return
+        
+        try:
+            async with self._gpu_sem:
+                results = await run_blocking(self._transcribe_jobs, jobs, audios)
+        except Exception as e:
+            for job in jobs:
+                self._fail_job(job, e)
+            return
+        
+        for job, key, result in zip(jobs, keys, results):
+            self._cache[key] = result
+            if len(self._cache) > settings.RESULT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+            await self._complete_job(job, result)
+    
+    async def _complete_job(self, job: TranscriptionJob, result: Dict[str, Any]) -> None:
+        """
+        Save a job's result to its output file and mark it completed.
+        
+        The result is not kept on the job; get_result reads it back from the file.
+        
+        Args:
+            job: The TranscriptionJob instance that finished
+            result: The transcription result
+        """
+        try:
+            # Save result to file
+            await run_blocking(_write_json, job.output_file, result)
+            
+            # Update job status
+            job.status = "completed"
+            job.completed_at = time.time()
+            
+            logger.info(f"Job {job.job_id} completed successfully")
+        
+        except Exception as e:
+            self._fail_job(job, e)
+        
+        finally:
+            job.done.set()
+    
+    @staticmethod
+    def _cache_key(job: TranscriptionJob, audio: np.ndarray) -> str:
+        """
+        Build the result cache key of a job.
+        
+        Args:
+            job: The TranscriptionJob instance
+            audio: The job's decoded audio samples
+            
+        Returns:
+            A digest of the samples joined with the options that affect the result
+        """
+        digest = hashlib.blake2b(audio.data, digest_size=16).hexdigest()
+        return f"{digest}|{job.model}|{job.language}|{job.temperature}|{job.word_timestamps}|{job.prompt}"
+    
+    def _transcribe_jobs(
+        self, jobs: List[TranscriptionJob], audios: List[np.ndarray]
+    ) -> List[Dict[str, Any]]:
+        """
+        Transcribe a batch of decoded audio inputs (blocking, run in a worker thread).
+        
+        Jobs without word timestamps are cut into fixed 30 s windows, pooled across the
+        batch and encoded BATCH_SIZE at a time, so concurrent short clips share a pass.
+        Word timestamps need sequential windows for the alignment, so those jobs are
+        stepped in lockstep with each other instead.
+        
+        Args:
+            jobs: The TranscriptionJob instances to transcribe
+            audios: The decoded 16 kHz samples of each job
+            
+        Returns:
+            One transcription result per job, in job order
+        """
+        options = [
+            {
+                "word_timestamps": job.word_timestamps,
+                "language": job.language,
+                "initial_prompt": job.prompt,
+                "temperature": job.temperature,
+            }
+            for job in jobs
+        ]
+        return mlx_whisper.transcribe_batch(audios, options=options, **self._base_kwargs)
+    
+    def _fail_job(self, job: TranscriptionJob, error: Exception) -> None:
+        """
+        Mark a transcription job as failed.
+        
+        Args:
+            job: The TranscriptionJob instance that failed
+            error: The exception that caused the failure
+        """
+        logger.error(f"Error processing job {job.job_id}: {error}")
+        job.status = "failed"
+        job.error = str(error)
+        job.completed_at = time.time()
+        job.done.set()
     
     def get_job(self, job_id: str) -> Optional[TranscriptionJob]:
         """
@@ -179,6 +383,22 @@ class TranscriptionService:
         """
         return self._jobs.get(job_id)
     
+    async def get_result(self, job: TranscriptionJob) -> Optional[Dict[str, Any]]:
+        """
+        Get the result of a transcription job, reading it from its output file if needed.
+        
+        Args:
+            job: The TranscriptionJob instance
+            
+        Returns:
+            The transcription result or None if the job has not completed
+        """
+        if job.result is not None:
+            return job.result
+        if job.status != "completed" or job.output_file is None:
+            return None
+        return await run_blocking(_read_json, job.output_file)
+    
     def list_jobs(self) -> List[TranscriptionJob]:
         """
         List all transcription jobs.
@@ -18,10 +18,25 @@ class ServerSettings(BaseSettings):
     # Model settings
     MODELS_DIR: Path = Field(default=Path("models"))
     BATCH_MODEL: str = Field(default="large-v3")
-    REALTIME_MODEL: str = Field(default="tiny")
+    REALTIME_MODEL: str = Field(default="distil-large-v3")
+    BATCH_MODEL_QUANT: Optional[int] = Field(default=4)  # bits, None keeps fp16 weights
+    REALTIME_MODEL_QUANT: Optional[int] = Field(default=4)
     
     # Audio settings
     MAX_AUDIO_SIZE_MB: int = Field(default=100)
+    REALTIME_MAX_CHUNK_SAMPLES: int = Field(default=30 * 16000)  # one Whisper window
+    # Incoming WebSocket frames are gathered until this much audio or this long has passed
+    REALTIME_COALESCE_SAMPLES: int = Field(default=16000)
+    REALTIME_COALESCE_MS: int = Field(default=100)
+    
+    # Realtime utterance segmentation (Silero VAD)
+    VAD_MODEL_PATH: Path = Field(default=Path("models/silero_vad.onnx"))
+    # Where to fetch the Silero VAD v5 ONNX model from when VAD_MODEL_PATH is missing
+    VAD_MODEL_REPO: str = Field(default="onnx-community/silero-vad")
+    VAD_MODEL_FILE: str = Field(default="onnx/model.onnx")
+    VAD_ON_THRESHOLD: float = Field(default=0.5)
+    VAD_OFF_THRESHOLD: float = Field(default=0.35)
+    VAD_HANGOVER_MS: int = Field(default=300)  # silence that ends an utterance
     SUPPORTED_FORMATS: List[str] = Field(
         default=["mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm"]
     )
@@ -32,6 +47,15 @@ class ServerSettings(BaseSettings):
     
     # Processing settings
     MAX_CONCURRENT_JOBS: int = Field(default=2)
+    MAX_TRANSCRIPTION_WAIT: Optional[float] = Field(default=None)  # seconds, None waits forever
+    JOB_RETENTION_SECONDS: int = Field(default=3600)  # finished jobs and their files are deleted after this
+    
+    # Dynamic batching: jobs arriving within the wait window share encoder passes
+    BATCH_MAX_SIZE: int = Field(default=8)
+    BATCH_MAX_WAIT_MS: int = Field(default=20)
+    # 30 s windows of one file encoded/decoded together (1 keeps sequential seeking)
+    BATCH_SIZE: int = Field(default=8)
+    RESULT_CACHE_SIZE: int = Field(default=128)  # results kept for resubmitted audio
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,20 +1,58 @@
 """
 Utility functions for the MLX Whisper servers.
 """
+import asyncio
+import dataclasses
+import functools
+import json
 import os
+import shutil
 import uuid
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import wave
 from pathlib import Path
-from typing import Optional, Union, BinaryIO
+from typing import Any, Callable, Dict, Optional, Union, BinaryIO
 
-import ffmpeg
-import aiofiles
+import av
+import mlx.core as mx
+import mlx.nn as nn
+import mlx_whisper
+import numpy as np
+import onnxruntime as ort
 from fastapi import UploadFile
+from huggingface_hub import hf_hub_download
+from mlx.utils import tree_flatten
+from mlx_whisper.audio import N_SAMPLES
 
 from whisper_servers.common.logging import logger
 from whisper_servers.common.config import settings
 
 
+# Bounded pool for blocking model, decode and file work; the default executor would
+# fan out to cpu_count + 4 threads that only contend for the same GPU queue
+_executor = ThreadPoolExecutor(
+    max_workers=settings.MAX_CONCURRENT_JOBS + 2,
+    thread_name_prefix="whisper-io",
+)
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking call on the servers' shared worker pool.
+    
+    Args:
+        func: The function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+        
+    Returns:
+        The return value of func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
 async def save_upload_file(upload_file: UploadFile, destination: Optional[Path] = None) -> Path:
     """
     Save an uploaded file to disk.
@@ -32,15 +70,51 @@ async def save_upload_file(upload_file: UploadFile, destination: Optional[Path]
         filename = f"{uuid.uuid4()}{ext}"
         destination = settings.UPLOAD_DIR / filename
     
-    async with aiofiles.open(destination, "wb") as out_file:
-        # Read chunks to avoid loading large files into memory
-        while content := await upload_file.read(1024 * 1024):  # 1MB chunks
-            await out_file.write(content)
+    if getattr(upload_file.file, "_rolled", False):
+        # Large uploads are already spooled to a temp file on disk; copy it in the kernel
+        await run_blocking(_copy_spooled_file, upload_file.file, destination)
+    else:
+        # Small uploads are still in memory; write them straight to a raw fd, which for
+        # a local file is quicker than a thread hop per chunk
+        fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while content := await upload_file.read(4 * 1024 * 1024):  # 4MB chunks
+                view = memoryview(content)
+                while view:
+                    view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
     
     logger.info(f"Saved uploaded file to {destination}")
     return destination
 
 
+def _copy_spooled_file(source: BinaryIO, destination: Path) -> None:
+    """
+    Copy an on-disk spooled upload to destination, using sendfile where supported.
+    
+    Args:
+        source: The rolled-over temporary file backing the upload
+        destination: Path to write the copy to
+    """
+    source.flush()
+    in_fd = source.fileno()
+    size = os.fstat(in_fd).st_size
+    
+    with open(destination, "wb") as out_file:
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(out_file.fileno(), in_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError:
+            # sendfile to a regular file is not supported on every platform (e.g. macOS)
+            source.seek(offset)
+            shutil.copyfileobj(source, out_file)
+
+
 def get_file_extension(filename: str) -> str:
     """
     Extract file extension from filename.
@@ -57,9 +131,40 @@ def get_file_extension(filename: str) -> str:
     return ext
 
 
+def decode_audio(input_file: Union[str, Path], sample_rate: int = 16000) -> np.ndarray:
+    """
+    Decode any audio file to mono float32 samples in-process with PyAV.
+    
+    Args:
+        input_file: Path to the input audio file
+        sample_rate: Sample rate of the returned audio in Hz
+        
+    Returns:
+        The audio samples in [-1, 1] as a 1-D float32 array
+    """
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=sample_rate)
+    chunks = []
+    
+    try:
+        with av.open(str(input_file)) as container:
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray()[0])
+            # Flush the samples still buffered in the resampler
+            for resampled in resampler.resample(None):
+                chunks.append(resampled.to_ndarray()[0])
+    except av.error.FFmpegError as e:
+        logger.error(f"Failed to decode {input_file}: {e}")
+        raise RuntimeError(f"Failed to decode audio file: {e}")
+    
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks)
+
+
 def convert_to_wav(input_file: Union[str, Path], output_file: Optional[Union[str, Path]] = None) -> Path:
     """
-    Convert any audio file to WAV format using ffmpeg.
+    Convert any audio file to a 16 kHz mono 16-bit WAV file.
     
     Args:
         input_file: Path to the input audio file
@@ -76,19 +181,17 @@ def convert_to_wav(input_file: Union[str, Path], output_file: Optional[Union[str
     
     output_file = Path(output_file)
     
-    try:
-        # Use ffmpeg to convert the file
-        (
-            ffmpeg
-            .input(str(input_file))
-            .output(str(output_file), acodec="pcm_s16le", ar="16000", ac=1)
-            .run(quiet=True, overwrite_output=True)
-        )
-        logger.info(f"Converted {input_file} to WAV format at {output_file}")
-        return output_file
-    except ffmpeg.Error as e:
-        logger.error(f"FFmpeg error: {e.stderr.decode() if e.stderr else str(e)}")
-        raise RuntimeError(f"Failed to convert audio file: {e}")
+    audio = decode_audio(input_file)
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    
+    with wave.open(str(output_file), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(pcm.tobytes())
+    
+    logger.info(f"Converted {input_file} to WAV format at {output_file}")
+    return output_file
 
 
 def is_audio_file(filename: str) -> bool:
@@ -105,6 +208,35 @@ def is_audio_file(filename: str) -> bool:
     return ext in settings.SUPPORTED_FORMATS
 
 
+def is_audio_content(header: bytes) -> bool:
+    """
+    Check whether the first bytes of a file look like a supported audio container.
+    
+    Args:
+        header: At least the first 12 bytes of the file
+        
+    Returns:
+        True if the magic bytes match WAV, MP3/MPEG audio, MP4/M4A, MPEG-PS or WebM
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return True
+    if header[:3] == b"ID3":
+        return True
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        # MPEG audio frame sync (mp3, mpga)
+        return True
+    if header[4:8] == b"ftyp":
+        # ISO base media file (mp4, m4a)
+        return True
+    if header[:4] == b"\x00\x00\x01\xba":
+        # MPEG program stream (mpeg)
+        return True
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        # EBML / Matroska (webm)
+        return True
+    return False
+
+
 def generate_unique_id() -> str:
     """
     Generate a unique ID for a transcription job.
@@ -113,3 +245,101 @@ def generate_unique_id() -> str:
         A unique ID string
     """
     return str(uuid.uuid4())
+
+
+def model_repo(model_name: str) -> str:
+    """
+    Map a model name to its Hugging Face repository.
+    
+    Args:
+        model_name: Model name, e.g. "large-v3", "large-v3-turbo" or "distil-large-v3"
+        
+    Returns:
+        The mlx-community repository holding the converted weights
+    """
+    if model_name.startswith("distil-"):
+        return f"mlx-community/distil-whisper-{model_name[len('distil-'):]}"
+    return f"mlx-community/whisper-{model_name}"
+
+
+def load_quantized_model(
+    model_path_or_repo: str,
+    quantized_dir: Path,
+    bits: int,
+    group_size: int = 64,
+) -> "mlx_whisper.whisper.Whisper":
+    """
+    Load a Whisper model with its linear and embedding layers quantized.
+    
+    The first load quantizes the full-precision model and saves it to quantized_dir in
+    the MLX Whisper layout (config.json + weights.safetensors), so later loads read the
+    quantized weights directly.
+    
+    Args:
+        model_path_or_repo: Local path or Hugging Face repo of the full-precision model
+        quantized_dir: Directory holding the cached quantized model
+        bits: Bits per weight
+        group_size: Number of weights sharing a scale and bias
+        
+    Returns:
+        The loaded, quantized model
+    """
+    if (quantized_dir / "weights.safetensors").exists():
+        return mlx_whisper.load_model(str(quantized_dir), dtype=mx.float16)
+    
+    logger.info(f"Quantizing {model_path_or_repo} to {bits} bits (group size {group_size})")
+    model = mlx_whisper.load_model(model_path_or_repo, dtype=mx.float16)
+    nn.quantize(model, group_size=group_size, bits=bits)
+    mx.eval(model.parameters())
+    
+    os.makedirs(quantized_dir, exist_ok=True)
+    config = dataclasses.asdict(model.dims)
+    config["quantization"] = {"group_size": group_size, "bits": bits}
+    with open(quantized_dir / "config.json", "w") as f:
+        json.dump(config, f, indent=2)
+    mx.save_safetensors(
+        str(quantized_dir / "weights.safetensors"), dict(tree_flatten(model.parameters()))
+    )
+    logger.info(f"Saved quantized model to {quantized_dir}")
+    
+    return model
+
+
+def load_vad_session(model_path: Path) -> ort.InferenceSession:
+    """
+    Load the Silero VAD ONNX model, downloading it first if it is not on disk.
+    
+    Args:
+        model_path: Local path of the ONNX model
+        
+    Returns:
+        An ONNX Runtime session for the model, on the CPU
+    """
+    if not model_path.exists():
+        logger.info(f"VAD model not found locally, downloading {settings.VAD_MODEL_FILE} from '{settings.VAD_MODEL_REPO}'")
+        downloaded = hf_hub_download(settings.VAD_MODEL_REPO, settings.VAD_MODEL_FILE)
+        os.makedirs(model_path.parent, exist_ok=True)
+        shutil.copyfile(downloaded, model_path)
+    
+    return ort.InferenceSession(str(model_path), providers=["CPUExecutionProvider"])
+
+
+def warmup_model(transcribe_kwargs: Dict[str, Any]) -> None:
+    """
+    Run a silent transcription so MLX compiles its kernels before the first request.
+    
+    The pass uses the service's own transcribe() arguments, so it compiles the path its
+    requests take: with a batch_size above 1 the audio spans one full window per batch
+    row, so the stacked encoder pass and batched decode are exercised.
+    
+    Args:
+        transcribe_kwargs: The service's transcribe() keyword arguments, model included
+    """
+    batch_size = transcribe_kwargs.get("batch_size", 1)
+    samples = batch_size * N_SAMPLES if batch_size > 1 else 2 * 16000
+    mlx_whisper.transcribe(
+        np.zeros(samples, dtype=np.float32),
+        **{**transcribe_kwargs, "language": transcribe_kwargs.get("language") or "en"},
+    )
+    # Release the buffers the warmup pass left in the allocator cache
+    mx.clear_cache()
@@ -6,6 +6,7 @@ import json
 import base64
 from typing import Optional, List, Dict, Any
 
+import msgpack
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -38,8 +39,9 @@ async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket endpoint for real-time transcription.
     
-    The client should send audio data as binary messages or as JSON with a base64-encoded audio field.
-    The server will respond with transcription results as JSON.
+    The client should send audio data as binary messages of raw PCM (16-bit, 16kHz, mono);
+    JSON with a base64-encoded audio field is still accepted but deprecated.
+    The server responds with transcription results and errors as msgpack-encoded binary messages.
     """
     await websocket.accept()
     
@@ -51,7 +53,7 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error(f"Error in WebSocket connection: {e}")
         try:
-            await websocket.send_json({"error": str(e)})
+            await websocket.send_bytes(msgpack.packb({"error": str(e)}, use_bin_type=True))
             await websocket.close()
         except:
             pass
@@ -4,18 +4,145 @@ Module for handling real-time transcriptions with the MLX Whisper model.
 import asyncio
 import base64
 import io
+import json
 import numpy as np
 import time
 from pathlib import Path
-from typing import Dict, Any, Optional, AsyncGenerator, Tuple, List
+from typing import Dict, Any, Optional, Tuple, List
 import os
 
 import mlx_whisper
+import msgpack
+import onnxruntime as ort
+from fastapi import WebSocket
 from pydantic import BaseModel, Field
-import websockets
 
 from whisper_servers.common.config import settings
 from whisper_servers.common.logging import logger
+from whisper_servers.common.utils import (
+    load_quantized_model,
+    load_vad_session,
+    model_repo,
+    run_blocking,
+    warmup_model,
+)
+
+
+class StreamSession:
+    """
+    Audio buffer and VAD state of one real-time WebSocket connection.
+    
+    Incoming PCM is scaled into a fixed float32 buffer and scored by Silero VAD in
+    512-sample frames. An utterance is handed out once the speaker has been silent for
+    VAD_HANGOVER_MS, or when the buffer holds a full 30 s Whisper window.
+    """
+    
+    FRAME_SIZE = 512  # samples per VAD frame at 16 kHz
+    CONTEXT_SIZE = 64  # trailing samples of the previous frame that Silero v5 expects in front
+    PREROLL_FRAMES = 4  # audio kept from before the detected start of speech
+    
+    def __init__(self, vad_session: ort.InferenceSession, sample_rate: int = 16000):
+        self._vad_session = vad_session
+        self._vad_sr = np.array(sample_rate, dtype=np.int64)
+        self._vad_state = np.zeros((2, 1, 128), dtype=np.float32)
+        # VAD model input: CONTEXT_SIZE samples of context followed by the frame
+        self._vad_input = np.zeros((1, self.CONTEXT_SIZE + self.FRAME_SIZE), dtype=np.float32)
+        self._hangover = settings.VAD_HANGOVER_MS * sample_rate // 1000
+        
+        self._buffer = np.empty(settings.REALTIME_MAX_CHUNK_SAMPLES, dtype=np.float32)
+        self._length = 0  # samples held in the buffer
+        self._vad_pos = 0  # samples already scored by the VAD
+        self._in_speech = False
+        self._silence = 0  # samples of silence since the last speech frame
+    
+    def append(self, audio_data: bytes) -> List[np.ndarray]:
+        """
+        Add raw PCM audio to the session.
+        
+        Args:
+            audio_data: Raw PCM audio data (16-bit, 16kHz, mono)
+            
+        Returns:
+            The utterances completed by this audio, oldest first
+        """
+        samples = np.frombuffer(audio_data, np.int16)
+        utterances = []
+        
+        while len(samples):
+            n = min(len(samples), len(self._buffer) - self._length)
+            np.multiply(
+                samples[:n],
+                np.float32(1 / 32768),
+                out=self._buffer[self._length:self._length + n],
+                casting="unsafe",
+            )
+            self._length += n
+            samples = samples[n:]
+            utterances.extend(self._scan())
+        
+        return utterances
+    
+    def flush(self) -> Optional[np.ndarray]:
+        """Return the buffered speech, if any, as a final utterance."""
+        if self._in_speech and self._length:
+            return self._cut(self._length)
+        return None
+    
+    def _scan(self) -> List[np.ndarray]:
+        """Run the VAD over the unscored frames and cut finished utterances."""
+        utterances = []
+        
+        while self._vad_pos + self.FRAME_SIZE <= self._length:
+            frame = self._buffer[self._vad_pos:self._vad_pos + self.FRAME_SIZE]
+            prob = self._speech_prob(frame)
+            self._vad_pos += self.FRAME_SIZE
+            threshold = settings.VAD_OFF_THRESHOLD if self._in_speech else settings.VAD_ON_THRESHOLD
+            
+            if prob >= threshold:
+                self._in_speech = True
+                self._silence = 0
+            elif self._in_speech:
+                self._silence += self.FRAME_SIZE
+                if self._silence >= self._hangover:
+                    utterances.append(self._cut(self._vad_pos))
+            else:
+                # Nobody is speaking; only keep the preroll
+                excess = self._vad_pos - self.PREROLL_FRAMES * self.FRAME_SIZE
+                if excess > 0:
+                    self._shift(excess)
+        
+        if self._length == len(self._buffer) and self._in_speech:
+            # A full Whisper window of speech; transcribe it without waiting for a pause
+            utterances.append(self._cut(self._length))
+        
+        return utterances
+    
+    def _speech_prob(self, frame: np.ndarray) -> float:
+        """Speech probability of one VAD frame."""
+        self._vad_input[0, :self.CONTEXT_SIZE] = self._vad_input[0, -self.CONTEXT_SIZE:]
+        self._vad_input[0, self.CONTEXT_SIZE:] = frame
+        prob, self._vad_state = self._vad_session.run(
+            None,
+            {"input": self._vad_input, "state": self._vad_state, "sr": self._vad_sr},
+        )
+        return float(prob[0][0])
+    
+    def _cut(self, end: int) -> np.ndarray:
+        """Remove and return the first end samples, resetting the VAD for the next utterance."""
+        utterance = self._buffer[:end].copy()
+        self._shift(end)
+        self._in_speech = False
+        self._silence = 0
+        self._vad_state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._vad_input.fill(0)
+        return utterance
+    
+    def _shift(self, n: int) -> None:
+        """Drop the first n samples of the buffer."""
+        remaining = self._length - n
+        self._buffer[:remaining] = self._buffer[n:self._length]
+        self._length = remaining
+        self._vad_pos = max(0, self._vad_pos - n)
 
 
 class RealtimeTranscriptionService:
@@ -25,103 +152,90 @@ class RealtimeTranscriptionService:
         self._model_path = settings.MODELS_DIR / settings.REALTIME_MODEL
         self._model_loaded = False
         self._model = None
-        self._buffer = []
+        self._vad_session: Optional[ort.InferenceSession] = None
         self._sample_rate = 16000  # Fixed sample rate for MLX Whisper
+        # One model call at a time; concurrent passes on the shared model only
+        # thrash its caches
+        self._gpu_sem = asyncio.Semaphore(1)
+        # Model-invariant transcribe() arguments, built once; "model" is set on load
+        self._base_kwargs: Dict[str, Any] = {
+            "model": None,
+            "path_or_hf_repo": None,  # Use already loaded model
+            # Distil models are English-only; auto-detect the language otherwise
+            "language": "en" if settings.REALTIME_MODEL.startswith("distil-") else None,
+            "word_timestamps": True,  # Include word-level timestamps
+            "truncate_mel": True,  # Encode only the utterance, not a padded 30 s window
+        }
     
     async def load_model(self) -> None:
-        """Load the MLX Whisper model if not already loaded."""
+        """Load the VAD and the MLX Whisper model and warm it up, if not already loaded."""
         if self._model_loaded:
             return
         
+        # The VAD goes first, so a missing or broken VAD model fails fast instead of
+        # after a full Whisper load
+        if self._vad_session is None:
+            try:
+                self._vad_session = await run_blocking(load_vad_session, settings.VAD_MODEL_PATH)
+            except Exception as e:
+                logger.error(f"Failed to load the VAD model: {e}")
+                raise
+        
         logger.info(f"Loading MLX Whisper model for real-time transcription: {settings.REALTIME_MODEL}")
         
         try:
             # Check if model exists, otherwise try to download it from the Hugging Face Hub
             model_path_or_repo = str(self._model_path)
             if not self._model_path.exists():
-                logger.info(f"Model not found locally, attempting to load from 'mlx-community/whisper-{settings.REALTIME_MODEL}'")
-                model_path_or_repo = f"mlx-community/whisper-{settings.REALTIME_MODEL}"
+                model_path_or_repo = model_repo(settings.REALTIME_MODEL)
+                logger.info(f"Model not found locally, attempting to load from '{model_path_or_repo}'")
             
-            # Load model (use to_thread because model loading is CPU-bound)
-            self._model = await asyncio.to_thread(mlx_whisper.load_model, model_path_or_repo)
+            # Load model (in a worker thread because model loading is CPU-bound)
+            if settings.REALTIME_MODEL_QUANT:
+                self._model = await run_blocking(
+                    load_quantized_model,
+                    model_path_or_repo,
+                    settings.MODELS_DIR / f"{settings.REALTIME_MODEL}-q{settings.REALTIME_MODEL_QUANT}",
+                    settings.REALTIME_MODEL_QUANT,
+                )
+            else:
+                self._model = await run_blocking(mlx_whisper.load_model, model_path_or_repo)
+            self._base_kwargs["model"] = self._model
+            await run_blocking(warmup_model, self._base_kwargs)
             self._model_loaded = True
             logger.info(f"MLX Whisper model loaded successfully for real-time transcription")
         except Exception as e:
             logger.error(f"Failed to load MLX Whisper model for real-time transcription: {e}")
             raise
     
-    async def process_audio_chunk(self, audio_data: bytes) -> Dict[str, Any]:
+    async def transcribe_utterance(self, audio: np.ndarray) -> Dict[str, Any]:
         """
-        Process a chunk of audio data.
+        Transcribe one complete utterance.
         
         Args:
-            audio_data: Raw PCM audio data (16-bit, 16kHz, mono)
+            audio: The utterance as float32 samples at 16 kHz
             
         Returns:
             Transcription result
         """
-        # Ensure model is loaded
-        await self.load_model()
-        
-        try:
-            # Convert bytes to numpy array (assuming 16-bit PCM)
-            audio_array = np.frombuffer(audio_data, np.int16).astype(np.float32) / 32768.0
-            
-            # Transcribe the audio chunk
-            result = await asyncio.to_thread(
-                mlx_whisper.transcribe,
-                audio_array,
-                model=self._model,
-                path_or_hf_repo=None,  # Use already loaded model
-                language=None,  # Auto-detect language
-                word_timestamps=True,  # Include word-level timestamps
-            )
-            
-            return result
-        except Exception as e:
-            logger.error(f"Error transcribing audio chunk: {e}")
-            raise
+        async with self._gpu_sem:
+            return await run_blocking(mlx_whisper.transcribe, audio, **self._base_kwargs)
     
-    async def process_base64_audio(self, base64_audio: str) -> Dict[str, Any]:
+    async def transcribe_websocket(self, websocket: WebSocket) -> None:
         """
-        Process base64-encoded audio data.
+        Handle WebSocket connection for real-time transcription.
         
-        Args:
-            base64_audio: Base64-encoded audio data
-            
-        Returns:
-            Transcription result
-        """
-        try:
-            # Decode base64 data
-            audio_data = base64.b64decode(base64_audio)
-            
-            # Process the audio data
-            return await self.process_audio_chunk(audio_data)
-        except Exception as e:
-            logger.error(f"Error processing base64 audio: {e}")
-            raise
-    
-    async def transcribe_stream(self, audio_stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[Dict[str, Any], None]:
-        """
-        Transcribe an audio stream in real-time.
+        Audio is sent as binary frames of raw PCM (16-bit, 16kHz, mono); JSON messages
+        with a base64 "audio" field are still accepted but deprecated. Audio is buffered
+        per connection and transcribed once per utterance, as cut by the VAD. A text
+        message {"type": "flush"} transcribes whatever speech is still buffered and is
+        answered with a result carrying "flushed": true.
         
-        Args:
-            audio_stream: Async generator that yields audio chunks
-            
-        Yields:
-            Transcription results for each chunk
-        """
-        # Ensure model is loaded
-        await self.load_model()
+        Results and errors are sent as msgpack-encoded binary frames.
         
-        async for audio_chunk in audio_stream:
-            result = await self.process_audio_chunk(audio_chunk)
-            yield result
-    
-    async def transcribe_websocket(self, websocket: websockets.WebSocketServerProtocol) -> None:
-        """
-        Handle WebSocket connection for real-time transcription.
+        Frames are read off the socket by a separate task, so they keep arriving while
+        an utterance is being transcribed, and small frames are coalesced until
+        REALTIME_COALESCE_SAMPLES of audio or REALTIME_COALESCE_MS have gathered.
         
         Args:
             websocket: WebSocket connection
@@ -129,48 +243,102 @@ class RealtimeTranscriptionService:
         # Ensure model is loaded
         await self.load_model()
         
+        session = StreamSession(self._vad_session, self._sample_rate)
+        queue: asyncio.Queue = asyncio.Queue()
+        pending = bytearray()  # audio received but not yet handed to the session
+        coalesce_bytes = settings.REALTIME_COALESCE_SAMPLES * 2
+        coalesce_wait = settings.REALTIME_COALESCE_MS / 1000
+        loop = asyncio.get_running_loop()
+        deadline = 0.0
+        
+        async def receive_messages() -> None:
+            try:
+                while True:
+                    message = await websocket.receive()
+                    queue.put_nowait(message)
+                    if message["type"] == "websocket.disconnect":
+                        return
+            except Exception as e:
+                queue.put_nowait(e)
+        
+        async def send_result(audio: Optional[np.ndarray], flushed: bool = False) -> None:
+            result = await self.transcribe_utterance(audio) if audio is not None else {}
+            response = {
+                "text": result.get("text", ""),
+                "language": result.get("language", ""),
+                "segments": result.get("segments", []),
+                "words": result.get("words", []),
+            }
+            if flushed:
+                response["flushed"] = True
+            await websocket.send_bytes(msgpack.packb(response, use_bin_type=True))
+        
+        async def send_error(message: str) -> None:
+            await websocket.send_bytes(msgpack.packb({"error": message}, use_bin_type=True))
+        
+        async def process_pending() -> None:
+            utterances = session.append(bytes(pending))
+            pending.clear()
+            for utterance in utterances:
+                await send_result(utterance)
+        
+        warned_base64 = False
+        receiver = asyncio.create_task(receive_messages())
+        
         try:
-            async for message in websocket:
-                # Parse the incoming message
-                if isinstance(message, str):
+            while True:
+                if pending:
                     try:
-                        import json
-                        data = json.loads(message)
-                        audio_base64 = data.get("audio")
-                        if audio_base64:
-                            # Process the audio data
-                            result = await self.process_base64_audio(audio_base64)
-                            
-                            # Send the result back
-                            await websocket.send(json.dumps({
-                                "text": result.get("text", ""),
-                                "language": result.get("language", ""),
-                                "segments": result.get("segments", []),
-                                "words": result.get("words", []),
-                            }))
+                        message = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        await process_pending()
+                        continue
+                else:
+                    message = await queue.get()
+                
+                if isinstance(message, Exception):
+                    raise message
+                if message["type"] == "websocket.disconnect":
+                    logger.info("WebSocket connection closed")
+                    break
+                
+                if message.get("bytes") is not None:
+                    # Raw audio data
+                    audio_data = message["bytes"]
+                elif message.get("text") is not None:
+                    try:
+                        data = json.loads(message["text"])
                     except json.JSONDecodeError:
                         logger.error("Invalid JSON message")
-                        await websocket.send(json.dumps({"error": "Invalid JSON message"}))
-                elif isinstance(message, bytes):
-                    # Process the raw audio data
-                    result = await self.process_audio_chunk(message)
+                        await send_error("Invalid JSON message")
+                        continue
                     
-                    # Send the result back
-                    await websocket.send(json.dumps({
-                        "text": result.get("text", ""),
-                        "language": result.get("language", ""),
-                        "segments": result.get("segments", []),
-                        "words": result.get("words", []),
-                    }))
-        except websockets.exceptions.ConnectionClosed:
-            logger.info("WebSocket connection closed")
+                    if data.get("type") == "flush":
+                        await process_pending()
+                        await send_result(session.flush(), flushed=True)
+                        continue
+                    if not data.get("audio"):
+                        continue
+                    if not warned_base64:
+                        logger.warning("Base64 JSON audio is deprecated; send raw PCM as binary frames")
+                        warned_base64 = True
+                    audio_data = base64.b64decode(data["audio"])
+                else:
+                    continue
+                
+                if not pending:
+                    deadline = loop.time() + coalesce_wait
+                pending += audio_data
+                if len(pending) >= coalesce_bytes:
+                    await process_pending()
         except Exception as e:
             logger.error(f"Error handling WebSocket connection: {e}")
             try:
-                await websocket.send(json.dumps({"error": str(e)}))
+                await send_error(str(e))
             except:
                 pass
-
+        finally:
+            receiver.cancel()
 
 # Create a global instance of the real-time transcription service
 transcription_service = RealtimeTranscriptionService()
@@ -29,6 +29,8 @@ def main():
         host="0.0.0.0",
         port=settings.BATCH_PORT,
         log_level="info",
+        loop="uvloop",
+        http="httptools",
     )
 
 